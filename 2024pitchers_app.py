@@ -1,29 +1,44 @@
 import streamlit as st
-import matplotlib.pyplot as plt
-import matplotlib.patches as patches
-import seaborn as sns
-import pandas as pd
-import numpy as np
-import math
+import os
+from concurrent.futures.process import BrokenProcessPool
 from datetime import datetime
 
+import pitch_data
+import pitch_plots
+import pitch_reports
+import pitch_timing
+
 # Load the real datase
+# Either a single TrackMan CSV or a directory of per-game CSV exports
 file_path = 'OM_OpposingPitchers_2024.csv'  # Replace with the correct ath in your Streamlit setup
 
-@st.cache_data
-def load_data(file_path):
-    return pd.read_csv(file_path, parse_dates=['Date'])  # Parse 'Date' column as datetime
-
-test_df = load_data(file_path)
-
-
-# Ensure numeric conversion for the columns where aggregation will be done
-numeric_columns = ['RelSpeed', 'SpinRate', 'Tilt', 'RelHeight', 'RelSide', 
-                   'Extension', 'InducedVertBreak', 'HorzBreak', 'VertApprAngle', 'ExitSpeed']
-
-# Coerce non-numeric values to NaN
-for col in numeric_columns:
-    test_df[col] = pd.to_numeric(test_df[col], errors='coerce')
+# Cheap stamp of the source file(s); changes when a game file is added or modified
+data_stamp = pitch_data.source_version(file_path)
+
+# Per-stage timings for this rerun, logged as JSON lines next to the cache. Peak memory
+# is only traced while the timings panel is open, since tracing slows every allocation.
+pitch_timing.configure_logging(os.path.join(pitch_data.cache_dir_for(file_path), pitch_timing.LOG_NAME))
+trace = pitch_timing.Trace(memory=st.session_state.get('show_timings', False), data_stamp=data_stamp)
+
+# Most recent prepared data per source, so a new version can reuse its aggregates and caches
+@st.cache_resource
+def get_latest_data():
+    return {}
+
+# The whole preparation pipeline, run once per data version and shared (read-only) by
+# every rerun and session: read the typed columnar copy of the data (only new or changed
+# files are parsed; numeric columns are coerced at ingest), derive the plate discipline
+# flags, and build the (Pitcher, Date) index and the aggregate cube. Sources too large to
+# load whole are streamed in chunks into a pitcher-partitioned store instead.
+@st.cache_resource(max_entries=2)
+def load_data(file_path, data_stamp):
+    data = pitch_reports.ReportData(file_path, previous=get_latest_data().get(file_path))
+    get_latest_data()[file_path] = data
+    return data
+
+with trace.span('load_data') as span:
+    report_data = load_data(file_path, data_stamp)
+    span['rows_out'] = report_data.pitches
 
 # Streamlit app layout
 st.title("EKU Pitcher Reports")
@@ -34,7 +49,7 @@ st.sidebar.header("Filters")
 # Dropdown widget to select the pitcher
 pitcher_name = st.sidebar.selectbox(
     "Select Pitcher:",
-    options=test_df['Pitcher'].unique()
+    options=report_data.pitchers()
 )
 
 # Dropdown widget to select the batter side (Right, Left, or Both)
@@ -81,39 +96,51 @@ elif date_filter_option == "Date Range":
         value=[datetime.today(), datetime.today()]
     )
 
+trace.context.update(pitcher=pitcher_name, batter_side=batter_side, strikes=strikes, balls=balls,
+                     date_filter=date_filter_option)
+
+# Pitch table sorted by (Pitcher, Date) with per-pitcher row offsets (only the selected
+# pitcher's partition for a source too large to load whole). Cache keys use per-pitcher
+# versions, so new games only invalidate the pitchers in them
+pitcher_index = report_data.pitcher_index(pitcher_name)
+
+# Sufficient statistics per (Pitcher, BatterSide, Balls, Strikes, Date, AutoPitchType)
+# backing the Pitch Traits and Plate Discipline tables (only the selected pitcher's
+# cells for a source too large to load whole)
+aggregate_cube = report_data.pitcher_cube(pitcher_name)
+
+# Filtered subsets shared by the report sections (and across reruns/sessions),
+# so each filter selection is only computed once
+filter_cache = report_data.filter_cache
+
+# Heat map density grids, keyed by filter selection and pitch type
+density_cache = report_data.density_cache
+
+# Rendered heat map and movement chart images (memory LRU + size-capped disk tier)
+@st.cache_resource
+def get_figure_cache(file_path):
+    return pitch_plots.FigureCache(os.path.join(pitch_data.cache_dir_for(file_path), 'figures'))
+
+figure_cache = get_figure_cache(file_path)
+
+# Worker processes rendering heat map panels in parallel, shared by all sessions
+@st.cache_resource
+def get_render_pool():
+    return pitch_plots.make_render_pool()
+
+render_pool = get_render_pool()
+
 # Function to filter data based on the dropdown selections and date filters
 def filter_data(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
-    # Filter data for the selected pitcher
-    pitcher_data = test_df[test_df['Pitcher'] == pitcher_name]
-
-    # Apply filtering for batter side, including 'Both' option
-    if batter_side == 'Both':
-        pitcher_data = pitcher_data[pitcher_data['BatterSide'].isin(['Right', 'Left'])]
-    else:
-        pitcher_data = pitcher_data[pitcher_data['BatterSide'] == batter_side]
-
-    # Apply filtering for strikes if 'All' is not selected
-    if strikes != 'All':
-        pitcher_data = pitcher_data[pitcher_data['Strikes'] == strikes]
-
-    # Apply filtering for balls if 'All' is not selected
-    if balls != 'All':
-        pitcher_data = pitcher_data[pitcher_data['Balls'] == balls]
-
-    # Apply date filtering
-    if date_filter_option == "Single Date" and selected_date:
-        # Convert selected_date to datetime if necessary
-        selected_datetime = pd.to_datetime(selected_date)
-        pitcher_data = pitcher_data[pitcher_data['Date'].dt.date == selected_datetime.date()]
-    elif date_filter_option == "Date Range" and start_date and end_date:
-        # Convert start_date and end_date to datetime if necessary
-        start_datetime = pd.to_datetime(start_date)
-        end_datetime = pd.to_datetime(end_date)
-        pitcher_data = pitcher_data[
-            (pitcher_data['Date'] >= start_datetime) & 
-            (pitcher_data['Date'] <= end_datetime)
-        ]
-
+    # Slice the pitcher's date window out of the sorted index, then apply
+    # the batter side, strikes and balls filters as a single mask
+    filters = (pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+    with trace.span('filter_data', rows_in=len(pitcher_index.df)) as span:
+        pitcher_data = filter_cache.get(
+            pitch_data.filter_key(pitcher_index, *filters),
+            lambda: pitch_data.filter_pitches(pitcher_index, *filters)
+        )
+        span['rows_out'] = len(pitcher_data)
     return pitcher_data
 
 # Function to create heatmaps for the selected pitcher, batter side, strikes, balls, and date filters
@@ -127,7 +154,7 @@ def plot_heatmaps(pitcher_name, batter_side, strikes, balls, date_filter_option,
             return
 
         # Remove rows where PlateLocSide or PlateLocHeight is NaN, for plotting purposes only
-        plot_data = pitcher_data.dropna(subset=['PlateLocSide', 'PlateLocHeight'])
+        plot_data = pitch_reports.heatmap_data(pitcher_data)
 
         if plot_data.empty:
             st.write("No data available to plot after filtering.")
@@ -136,160 +163,97 @@ def plot_heatmaps(pitcher_name, batter_side, strikes, balls, date_filter_option,
         # Get unique pitch types thrown by the selected pitcher
         unique_pitch_types = plot_data['AutoPitchType'].unique()
 
-        # Limit number of subplots per row (e.g., 3 per row)
-        n_pitch_types = len(unique_pitch_types)
-        plots_per_row = 3  # Set number of plots per row
-        n_rows = math.ceil(n_pitch_types / plots_per_row)  # Calculate the number of rows needed
-
-        # Adjust figure size dynamically
-        fig_width = 12 * plots_per_row  # Set width based on number of plots per row
-        fig_height = 16 * n_rows  # Set height to fit all rows
-
-        # Create subplots with the appropriate number of rows and columns
-        fig, axes = plt.subplots(n_rows, plots_per_row, figsize=(fig_width, fig_height))
-
-        if n_pitch_types == 1:
-            axes = [axes]  # Ensure axes is iterable
-        else:
-            axes = axes.flatten()  # Flatten axes array for easier access
-
-        # Loop over each unique pitch type and create heatmaps
-        for i, (ax, pitch_type) in enumerate(zip(axes, unique_pitch_types)):
-            pitch_type_data = plot_data[plot_data['AutoPitchType'] == pitch_type]
-
-            if len(pitch_type_data) < 5:  # Switch to scatter plot for small data
-                sns.scatterplot(
-                    x=pitch_type_data['PlateLocSide'], 
-                    y=pitch_type_data['PlateLocHeight'], 
-                    ax=ax, 
-                    color='blue'
-                )
-            else:
-                bw_adjust_value = 0.5 if len(pitch_type_data) > 50 else 1  # Adjust bandwidth for small datasets
-                sns.kdeplot(
-                    x=pitch_type_data['PlateLocSide'], 
-                    y=pitch_type_data['PlateLocHeight'], 
-                    fill=True, 
-                    cmap='Spectral_r', 
-                    levels=6, 
-                    ax=ax,
-                    bw_adjust=bw_adjust_value
-                )
-
-            # Plot individual pitch locations as dots
-            ax.scatter(
-                pitch_type_data['PlateLocSide'], 
-                pitch_type_data['PlateLocHeight'], 
-                color='black',  # Color for the dots
-                edgecolor='white',  # Add a white border to make dots stand out
-                s=300,  # Size of the dots
-                alpha=0.7  # Transparency to allow overlap
-            )
-
-            # Add strike zone as a rectangle with black edgecolor
-            strike_zone_width = 1.66166  # feet changed for widest raw strike (formerly 17/12)
-            strike_zone_params = {
-                'x_start': -strike_zone_width / 2,
-                'y_start': 1.5,
-                'width': strike_zone_width,
-                'height': 3.3775 - 1.5
-            }
-            strike_zone = patches.Rectangle(
-                (strike_zone_params['x_start'], strike_zone_params['y_start']),
-                strike_zone_params['width'],
-                strike_zone_params['height'],
-                edgecolor='black',  # Black edge color for the strike zone
-                facecolor='none',
-                linewidth=2
-            )
-            ax.add_patch(strike_zone)
-
-            # Set axis limits and remove ticks
-            ax.set_xlim(-2, 2)
-            ax.set_ylim(1, 4)
-            ax.set_xticks([])  # Remove x-ticks
-            ax.set_yticks([])  # Remove y-ticks
-
-            # Remove axis labels
-            ax.set_xlabel('')
-            ax.set_ylabel('')
-
-            # Set pitch type as title
-            ax.set_title(f"{pitch_type} ({pitcher_name})", fontsize=20)
-
-            # Equal aspect ratio
-            ax.set_aspect('equal', adjustable='box')
-
-        # Remove any unused subplots
-        for j in range(len(unique_pitch_types), len(axes)):
-            fig.delaxes(axes[j])
-
-        # Add a main title for all the heatmaps
-        plt.suptitle(f"{pitcher_name} Heat Maps (Batter: {batter_side}, Strikes: {strikes}, Balls: {balls})", fontsize=30, fontweight='bold')
-
-        # Adjust the layout to prevent overlap
-        plt.tight_layout(rect=[0, 0, 1, 0.95])  # Leave space at the top for suptitle
-
-        # Show the updated figure
-        st.pyplot(fig)
+        # Main title for all the heatmaps
+        st.subheader(pitch_reports.heatmap_title(pitcher_name, batter_side, strikes, balls))
+
+        # One placeholder per panel, 3 per row, filled in as each panel finishes
+        plots_per_row = 3
+        placeholders = []
+        for row_start in range(0, len(unique_pitch_types), plots_per_row):
+            columns = st.columns(plots_per_row)
+            placeholders.extend(column.empty() for column in columns)
+
+        selection_key = pitch_data.filter_key(pitcher_index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+
+        # Show cached panels straight away and collect the rest for rendering
+        missing = []
+        with trace.span('cached_panels', rows_in=len(unique_pitch_types)) as span:
+            for i, pitch_type in enumerate(unique_pitch_types):
+                panel_key = ('heatmap-panel', pitch_plots.panel_dpi) + selection_key + (pitch_type,)
+                image = figure_cache.get(panel_key)
+                if image is not None:
+                    placeholders[i].image(image)
+                else:
+                    missing.append((i, panel_key, pitch_type))
+            span['rows_out'] = len(unique_pitch_types) - len(missing)
+
+        with trace.span('heatmap_density', rows_in=len(plot_data)) as span:
+            panels = pitch_reports.heatmap_panels(plot_data, pitcher_name, selection_key, density_cache,
+                                                  pitch_types=[pitch_type for _, _, pitch_type in missing])
+            span['rows_out'] = len(panels)
+        pending = [(i, panel_key, panel) for (i, panel_key, _), (_, panel) in zip(missing, panels)]
+
+        # Render the missing panels in parallel, streaming each one to the page as it completes
+        panels = [panel for _, _, panel in pending]
+        rendered = set()
+        with trace.span('render_panels', rows_in=len(panels)) as span:
+            try:
+                for j, image in pitch_plots.render_panels(panels, render_pool):
+                    i, panel_key, _ = pending[j]
+                    figure_cache.put(panel_key, image)
+                    placeholders[i].image(image)
+                    rendered.add(j)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for memory), which breaks the pool for good: drop
+                # it so the next rerun starts a fresh one, and draw the rest in this process
+                render_pool.shutdown(wait=False, cancel_futures=True)
+                get_render_pool.clear()
+                for j, (i, panel_key, panel) in enumerate(pending):
+                    if j not in rendered:
+                        image = pitch_plots.render_heatmap_panel(*panel)
+                        figure_cache.put(panel_key, image)
+                        placeholders[i].image(image)
+            span['rows_out'] = len(panels)
     except Exception as e:
         st.write(f"Error generating heatmaps: {e}")
 
-# Function to calculate InZone% and Chase%
-def calculate_in_zone(df):
-    # Strike zone boundaries
-    in_zone = df[
-        (df['PlateLocHeight'] >= 1.5) & 
-        (df['PlateLocHeight'] <= 3.3775) & 
-        (df['PlateLocSide'] >= -0.83083) & 
-        (df['PlateLocSide'] <= 0.83083)
-    ]
-    return in_zone
-
 # Function to manually format the dataframe before displaying
-def format_dataframe(df):
-    df = df.copy()  # Create a copy to avoid warnings
-    percent_columns = ['InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%']
-
-    for col in df.columns:
-        if col in percent_columns:
-            df[col] = df[col].apply(lambda x: f"{round(x, 2)}%" if pd.notna(x) and isinstance(x, (int, float)) else 'N/A')  # Add % symbol to percentage columns
-        elif df[col].dtype.kind in 'f':  # if it's a float type column
-            df[col] = df[col].apply(lambda x: round(x, 2) if pd.notna(x) else 'N/A')
-        else:
-            df[col] = df[col].fillna('N/A')  # Fill NaN with N/A for non-float columns
-    return df
+format_dataframe = pitch_reports.format_dataframe
+
+# Part of a formatted table's cache key for its percentile columns: D1-wide ranks change
+# with anyone's data, so tables with them are keyed by the whole data version (the
+# selection's key only holds the pitcher's own version)
+def percentiles_version(show_percentiles):
+    return report_data.version if show_percentiles else None
 
 # Function to generate the pitch traits table
-def generate_pitch_traits_table(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
+def generate_pitch_traits_table(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date, show_percentiles=True):
     try:
-        pitcher_data = filter_data(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+        def traits_table():
+            # Count and mean values for each 'AutoPitchType', rolled up from the aggregate cube
+            # and sorted by Count (most thrown to least thrown)
+            with trace.span('pitch_traits_table') as span:
+                grouped_data = pitch_reports.pitch_traits_table(aggregate_cube, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+                span['rows_out'] = pitch_timing.rows(grouped_data)
 
-        if pitcher_data.empty:
+            if grouped_data is None:
+                return None
+
+            # Add the D1-wide percentile rank next to each trait
+            if show_percentiles:
+                grouped_data = pitch_reports.with_percentiles(grouped_data, report_data.ranks)
+
+            # Format the data before displaying
+            return format_dataframe(grouped_data)
+
+        # Reuse the formatted table for as long as the selection is unchanged
+        table_key = ('pitch_traits', percentiles_version(show_percentiles)) + pitch_data.filter_key(pitcher_index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+        formatted_data = report_data.table_cache.get(table_key, traits_table)
+
+        if formatted_data is None:
             st.write("No data available for the selected parameters.")
             return
 
-        # Group by 'AutoPitchType' and calculate mean values for each group
-        grouped_data = pitcher_data.groupby('AutoPitchType').agg(
-            Count=('AutoPitchType', 'size'),
-            RelSpeed=('RelSpeed', 'mean'),
-            InducedVertBreak=('InducedVertBreak', 'mean'),
-            HorizontalBreak=('HorzBreak', 'mean'), 
-            SpinRate=('SpinRate', 'mean'),
-            RelHeight=('RelHeight', 'mean'),
-            RelSide=('RelSide', 'mean'),
-            Extension=('Extension', 'mean'),
-            VertApprAngle=('VertApprAngle', 'mean'),
-            Tilt=('Tilt', 'mean'),
-            ExitSpeed=('ExitSpeed', lambda x: x.mean() if x.notna().sum() > 0 else 'N/A')
-        ).reset_index()
-
-        # Sort by Count (most thrown to least thrown)
-        grouped_data = grouped_data.sort_values(by='Count', ascending=False)
-
-        # Format the data before displaying
-        formatted_data = format_dataframe(grouped_data)
-
         # Display the table in Streamlit
         st.subheader("Pitch Traits:")
         st.dataframe(formatted_data)
@@ -298,32 +262,32 @@ def generate_pitch_traits_table(pitcher_name, batter_side, strikes, balls, date_
 
 # Function to generate the plate discipline table
 # Function to generate the plate discipline table with Strike% column
-def generate_plate_discipline_table(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
+def generate_plate_discipline_table(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date, show_percentiles=True):
     try:
-        pitcher_data = filter_data(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+        def plate_discipline_table():
+            # Plate discipline metrics per pitch type rolled up from the aggregate cube,
+            # sorted by Count (most thrown to least thrown)
+            with trace.span('plate_discipline_table') as span:
+                plate_discipline_data = pitch_reports.plate_discipline_table(aggregate_cube, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+                span['rows_out'] = pitch_timing.rows(plate_discipline_data)
 
-        if pitcher_data.empty:
-            st.write("No data available for the selected parameters.")
-            return
+            if plate_discipline_data is None:
+                return None
 
-        # Calculate total pitches
-        total_pitches = len(pitcher_data)
+            # Add the D1-wide percentile rank next to each rate
+            if show_percentiles:
+                plate_discipline_data = pitch_reports.with_percentiles(plate_discipline_data, report_data.ranks)
 
-        # Group by 'AutoPitchType' and calculate plate discipline metrics
-        plate_discipline_data = pitcher_data.groupby('AutoPitchType').apply(calculate_metrics).apply(pd.Series).reset_index()
+            # Format the data before displaying
+            return format_dataframe(plate_discipline_data)
 
-        # Calculate the Pitch% column
-        plate_discipline_data['Count'] = pitcher_data.groupby('AutoPitchType')['AutoPitchType'].count().values
-        plate_discipline_data['Pitch%'] = (plate_discipline_data['Count'] / total_pitches) * 100
+        # Reuse the formatted table for as long as the selection is unchanged
+        table_key = ('plate_discipline', percentiles_version(show_percentiles)) + pitch_data.filter_key(pitcher_index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+        formatted_data = report_data.table_cache.get(table_key, plate_discipline_table)
 
-        # Sort by Count (most thrown to least thrown)
-        plate_discipline_data = plate_discipline_data.sort_values(by='Count', ascending=False)
-
-        # Reorder columns
-        plate_discipline_data = plate_discipline_data[['AutoPitchType', 'Count', 'Pitch%', 'Strike%', 'InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%']]
-
-        # Format the data before displaying
-        formatted_data = format_dataframe(plate_discipline_data)
+        if formatted_data is None:
+            st.write("No data available for the selected parameters.")
+            return
 
         # Display the table in Streamlit
         st.subheader("Plate Discipline:")
@@ -333,84 +297,17 @@ def generate_plate_discipline_table(pitcher_name, batter_side, strikes, balls, d
 
 
 
-def calculate_metrics(df):
-    in_zone_pitches = calculate_in_zone(df)
-    total_in_zone = len(in_zone_pitches)
-
-    # Define what constitutes a swing
-    swing_conditions = ['StrikeSwinging', 'FoulBallFieldable', 'FoulBallNotFieldable', 'InPlay']
-    total_swings = df[df['PitchCall'].isin(swing_conditions)].shape[0]
-    total_whiffs = df[df['PitchCall'] == 'StrikeSwinging'].shape[0]
-    total_chase = df[
-        (~df.index.isin(in_zone_pitches.index)) & 
-        df['PitchCall'].isin(swing_conditions)
-    ].shape[0]
-
-    in_zone_whiffs = in_zone_pitches[in_zone_pitches['PitchCall'] == 'StrikeSwinging'].shape[0]
-
-    # Define what constitutes a strike
-    strike_conditions = ['StrikeCalled', 'FoulBallFieldable', 'FoulBallNotFieldable', 'StrikeSwinging', 'InPlay']
-    total_strikes = df[df['PitchCall'].isin(strike_conditions)].shape[0]
-
-    metrics = {
-        'InZone%': (total_in_zone / len(df)) * 100 if len(df) > 0 else 'N/A',
-        'Swing%': (total_swings / len(df)) * 100 if len(df) > 0 else 'N/A',
-        'Whiff%': (total_whiffs / total_swings) * 100 if total_swings > 0 else 'N/A',
-        'Chase%': (total_chase / total_swings) * 100 if total_swings > 0 else 'N/A',
-        'InZoneWhiff%': (in_zone_whiffs / total_in_zone) * 100 if total_in_zone > 0 else 'N/A',
-        'Strike%': (total_strikes / len(df)) * 100 if len(df) > 0 else 'N/A'
-    }
-    return metrics
-
-
-# Main logic for generating the plate discipline table
-try:
-    # Group by 'AutoPitchType' and calculate plate discipline metrics
-    plate_discipline_data = pitcher_data.groupby('AutoPitchType').apply(calculate_metrics).apply(pd.Series).reset_index()
-
-    # Calculate the Pitch% column
-    plate_discipline_data['Count'] = pitcher_data.groupby('AutoPitchType')['AutoPitchType'].count().values
-    plate_discipline_data['Pitch%'] = (plate_discipline_data['Count'] / total_pitches) * 100
-
-    # Sort by Count (most thrown to least thrown)
-    plate_discipline_data = plate_discipline_data.sort_values(by='Count', ascending=False)
-
-    # Reorder columns
-    plate_discipline_data = plate_discipline_data[['AutoPitchType', 'Count', 'Pitch%', 'Strike%', 'InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%']]
-
-    # Format the data before displaying
-    formatted_data = format_dataframe(plate_discipline_data)
-
-    # Display the table in Streamlit
-    st.subheader("Plate Discipline:")
-    st.dataframe(formatted_data)
-
-except Exception as e:
-    st.write(f"Error generating plate discipline table: {e}")
-
-
-
-
-# Define a color dictionary for each pitch type
-color_dict = {
-    'Fastball': 'blue',
-    'FourSeamFastball': 'blue',
-    'Four-Seam': 'blue',
-    'TwoSeamFastball': 'gold',
-    'Sinker': 'gold',
-    'Slider': 'green',
-    'Curveball': 'red',
-    'Cutter': 'orange',
-    'ChangeUp': 'purple',
-    'Changeup': 'purple',
-    'Splitter': 'teal',
-    'Unknown': 'black',
-    'Other': 'black'
-}
-
 # Updated plot_pitch_movement function with color dictionary
 def plot_pitch_movement(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
     try:
+        # Reuse the rendered image if this selection has been drawn before
+        figure_key = ('movement', pitch_plots.figure_dpi) + pitch_data.filter_key(pitcher_index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+        image = figure_cache.get(figure_key)
+        if image is not None:
+            st.subheader("Pitch Movement Graph:")
+            st.image(image)
+            return
+
         # Filter data based on the selected parameters
         pitcher_data = filter_data(pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
 
@@ -419,86 +316,135 @@ def plot_pitch_movement(pitcher_name, batter_side, strikes, balls, date_filter_o
             return
 
         # Ensure InducedVertBreak and HorizontalBreak are available for plotting
-        movement_data = pitcher_data.dropna(subset=['InducedVertBreak', 'HorzBreak'])
+        movement_data = pitch_reports.movement_data(pitcher_data)
 
         if movement_data.empty:
             st.write("No pitch movement data available for plotting.")
             return
 
-        # Set up the figure for pitch movement
-        plt.figure(figsize=(8, 8))
-        ax = plt.gca()
-
-        # Set axis limits and labels
-        ax.set_xlim(-25, 25)
-        ax.set_ylim(-25, 25)
-        ax.set_xlabel("Horizontal Break (inches)", fontsize=12)
-        ax.set_ylabel("Induced Vertical Break (inches)", fontsize=12)
-
-        # Add grid lines every 5 units
-        ax.xaxis.set_major_locator(plt.MultipleLocator(5))
-        ax.yaxis.set_major_locator(plt.MultipleLocator(5))
-        plt.grid(True, which='both', linestyle='--', linewidth=0.5)
-
-        # Add bold black lines through the origin
-        plt.axhline(0, color='black', linewidth=2, zorder=1)  # Horizontal line through the origin
-        plt.axvline(0, color='black', linewidth=2, zorder=1)  # Vertical line through the origin
-
-        # Plot each pitch, colored by pitch type, with a higher z-order
-        unique_pitch_types = movement_data['AutoPitchType'].unique()
-        for pitch_type in unique_pitch_types:
-            pitch_type_data = movement_data[movement_data['AutoPitchType'] == pitch_type]
-
-            # Set color based on pitch type, default to black for unknown types
-            color = color_dict.get(pitch_type, 'black')
-
-            # Plot individual pitches
-            plt.scatter(
-                pitch_type_data['HorzBreak'], 
-                pitch_type_data['InducedVertBreak'], 
-                label=pitch_type, 
-                color=color,
-                s=50, 
-                alpha=0.7,
-                zorder=2  # Higher z-order to plot above the lines
-            )
-
-            # Calculate the mean and standard deviation for clustering
-            mean_horz = pitch_type_data['HorzBreak'].mean()
-            mean_vert = pitch_type_data['InducedVertBreak'].mean()
-            std_dev = np.sqrt(pitch_type_data['HorzBreak'].std()**2 + pitch_type_data['InducedVertBreak'].std()**2)
-
-            # Draw a circle to represent the cluster area
-            circle = plt.Circle((mean_horz, mean_vert), std_dev, color=color, alpha=0.3, zorder=1)
-            ax.add_patch(circle)
-
-        # Add a legend for pitch types
-        plt.legend(title="Pitch Type", bbox_to_anchor=(1.05, 1), loc='upper left')
+        # Render on a private Agg figure (safe with concurrent sessions), then cache the image
+        with trace.span('render_movement_chart', rows_in=len(movement_data)):
+            image = pitch_plots.render_movement_chart(movement_data)
+            figure_cache.put(figure_key, image)
 
         # Display the plot in Streamlit
         st.subheader("Pitch Movement Graph:")
-        st.pyplot(plt)
+        st.image(image)
     except Exception as e:
         st.write(f"Error generating pitch movement graph: {e}")
 
+# The report sections below are fragments: a change to a widget inside one (the percentile
+# toggle, the comp pitch type) reruns only that section. Such a rerun gets its own trace,
+# since the page's trace is already finished by then; the fragment finishes it.
+def begin_fragment_trace(name):
+    global trace
+    if not trace.finished:
+        return None
+    trace = pitch_timing.Trace(name, memory=st.session_state.get('show_timings', False), data_stamp=data_stamp)
+    return trace
+
+# Function to generate the plate discipline and pitch traits tables, with the option to
+# rank each metric against every pitcher in the data throwing the same pitch type
+@st.fragment
+def generate_report_tables(*filters):
+    fragment_trace = begin_fragment_trace('generate_report_tables')
+    show_percentiles = st.toggle("Show D1 percentile ranks", value=True, key='show_percentiles')
+
+    with trace.span('generate_plate_discipline_table'):
+        generate_plate_discipline_table(*filters, show_percentiles=show_percentiles)
+
+    with trace.span('generate_pitch_traits_table'):
+        generate_pitch_traits_table(*filters, show_percentiles=show_percentiles)
+
+    if fragment_trace:
+        fragment_trace.finish()
+
+# Function to show the pitch types of other pitchers most similar to one of the selected pitcher's
+@st.fragment
+def generate_pitch_comps(pitcher_name):
+    fragment_trace = begin_fragment_trace('generate_pitch_comps')
+    try:
+        comps = report_data.comps()
+        pitch_types = comps.pitch_types(pitcher_name)
+
+        if not pitch_types:
+            st.write("No pitch comps available for the selected pitcher.")
+            return
+
+        st.subheader("Pitch Comps:")
+        pitch_type = st.selectbox("Select Pitch Type:", options=pitch_types, key='comp_pitch_type')
+
+        # Nearest pitch types by average velocity, movement, spin and release (all games, both sides)
+        with trace.span('pitch_comps', rows_in=len(comps.candidates)) as span:
+            nearest = comps.nearest(pitcher_name, pitch_type)
+            span['rows_out'] = pitch_timing.rows(nearest)
+
+        if nearest is None or nearest.empty:
+            st.write("No comparable pitches found for this pitch type.")
+            return
+
+        st.caption("Most similar pitch types thrown by other pitchers, by season averages (closest first).")
+        st.dataframe(format_dataframe(nearest))
+    except Exception as e:
+        st.write(f"Error generating pitch comps: {e}")
+    finally:
+        if fragment_trace:
+            fragment_trace.finish()
+
 
 
 
 
+# Function to chart the selected pitcher's game-by-game average (and max) of one metric per
+# pitch type. Reads only the game-level rollup; the batter side and count filters don't apply.
+@st.fragment
+def plot_pitch_trends(pitcher_name, date_filter_option, selected_date, start_date, end_date):
+    fragment_trace = begin_fragment_trace('plot_pitch_trends')
+    try:
+        st.subheader("Pitch Trends by Game:")
+        metric = st.selectbox("Select Metric:", options=list(pitch_data.trend_columns), key='trend_metric')
+
+        # Reuse the rendered image while the pitcher's games and the date window are unchanged
+        figure_key = ('trend', metric, pitch_plots.figure_dpi, pitcher_index.key_version(pitcher_name), pitcher_name) + \
+            pitch_data.date_bounds(date_filter_option, selected_date, start_date, end_date)
+        image = figure_cache.get(figure_key)
+        if image is None:
+            with trace.span('trend_table') as span:
+                games = pitch_reports.trend_table(report_data.pitcher_games(pitcher_name), pitcher_name, date_filter_option, selected_date, start_date, end_date)
+                span['rows_out'] = pitch_timing.rows(games)
+
+            if games is None:
+                st.write("No game data available for the selected parameters.")
+                return
+
+            with trace.span('render_trend_chart', rows_in=len(games)):
+                image = pitch_plots.render_trend_chart(games, metric)
+                figure_cache.put(figure_key, image)
+
+        st.caption("Per-game averages by pitch type (dotted: game max). All batters and counts.")
+        st.image(image)
+    except Exception as e:
+        st.write(f"Error generating pitch trends: {e}")
+    finally:
+        if fragment_trace:
+            fragment_trace.finish()
+
+
 # Generate heatmaps based on selections
-plot_heatmaps(
-    pitcher_name, 
-    batter_side, 
-    strikes, 
-    balls, 
-    date_filter_option, 
-    selected_date, 
-    start_date, 
-    end_date
-)
+with trace.span('plot_heatmaps'):
+    plot_heatmaps(
+        pitcher_name, 
+        batter_side, 
+        strikes, 
+        balls, 
+        date_filter_option, 
+        selected_date, 
+        start_date, 
+        end_date
+    )
 
 # Generate and display the pitch traits and plate discipline tables
-generate_plate_discipline_table(
+generate_report_tables(
     pitcher_name, 
     batter_side, 
     strikes, 
@@ -509,25 +455,34 @@ generate_plate_discipline_table(
     end_date
 )
 
-generate_pitch_traits_table(
-    pitcher_name, 
-    batter_side, 
-    strikes, 
-    balls, 
-    date_filter_option, 
-    selected_date, 
-    start_date, 
-    end_date
-)
 
+with trace.span('plot_pitch_movement'):
+    plot_pitch_movement(
+        pitcher_name, 
+        batter_side, 
+        strikes, 
+        balls, 
+        date_filter_option, 
+        selected_date, 
+        start_date, 
+        end_date
+    )
+
+with trace.span('plot_pitch_trends'):
+    plot_pitch_trends(pitcher_name, date_filter_option, selected_date, start_date, end_date)
 
-plot_pitch_movement(
-    pitcher_name, 
-    batter_side, 
-    strikes, 
-    balls, 
-    date_filter_option, 
-    selected_date, 
-    start_date, 
-    end_date
-)
+with trace.span('generate_pitch_comps'):
+    generate_pitch_comps(pitcher_name)
+
+
+# Optional debug panel with this rerun's stage timings and the shared caches' hit/miss
+# counters (since the process started), which are also logged with the trace
+caches = {'filter': filter_cache, 'density': density_cache, 'table': report_data.table_cache, 'figure': figure_cache}
+trace.context['caches'] = {name: cache.stats() for name, cache in caches.items()}
+trace.finish()
+if st.sidebar.checkbox("Show stage timings", key='show_timings'):
+    st.sidebar.header("Stage Timings")
+    st.sidebar.write(f"Rerun total: {trace.finish()['total_ms']:.0f} ms")
+    st.sidebar.write(f"Pitch table: {pitcher_index.df.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory")
+    st.sidebar.dataframe(trace.table(), hide_index=True)
+    st.sidebar.dataframe([{'Cache': name, **stats} for name, stats in trace.context['caches'].items()], hide_index=True)
@@ -0,0 +1,182 @@
+import argparse
+import base64
+import html
+import io
+import math
+import multiprocessing
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import matplotlib.image as mpimg
+from matplotlib.figure import Figure
+
+import pitch_plots
+import pitch_reports
+
+# Report data for this process: loaded once in the parent and inherited by forked
+# workers, or loaded by the worker initializer where fork isn't available
+report_data = None
+
+
+def init_worker(path):
+    global report_data
+    if report_data is None:
+        report_data = pitch_reports.ReportData(path)
+
+
+# Safe file name for a pitcher ("Last, First" -> "Last_First")
+def slugify(name):
+    return re.sub(r'[^A-Za-z0-9]+', '_', str(name)).strip('_') or 'pitcher'
+
+
+def image_tag(image):
+    return f'<img src="data:image/png;base64,{base64.b64encode(image).decode()}">'
+
+
+def table_html(table):
+    if table is None:
+        return '<p>No data available for the selected parameters.</p>'
+    return pitch_reports.format_dataframe(table).to_html(index=False, border=0)
+
+
+# Standalone HTML page with the images embedded
+def report_html(report, panel_images, movement_image):
+    if panel_images:
+        heatmaps = '<div class="panels">' + ''.join(image_tag(image) for image in panel_images) + '</div>'
+    else:
+        heatmaps = '<p>No data available to plot after filtering.</p>'
+    movement = image_tag(movement_image) if movement_image else '<p>No pitch movement data available for plotting.</p>'
+    return f"""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>{html.escape(report['title'])}</title>
+<style>
+body {{ font-family: sans-serif; margin: 2em; }}
+.panels {{ display: grid; grid-template-columns: repeat(3, 1fr); gap: 1em; }}
+.panels img, .movement img {{ width: 100%; }}
+.movement {{ max-width: 40em; }}
+table {{ border-collapse: collapse; margin-bottom: 2em; }}
+th, td {{ padding: 0.3em 0.8em; border-bottom: 1px solid #ddd; text-align: right; }}
+@media print {{ .panels {{ page-break-after: always; }} }}
+</style>
+</head>
+<body>
+<h1>{html.escape(report['title'])}</h1>
+{heatmaps}
+<h2>Plate Discipline:</h2>
+{table_html(report['plate_discipline'])}
+<h2>Pitch Traits:</h2>
+{table_html(report['pitch_traits'])}
+<h2>Pitch Movement Graph:</h2>
+<div class="movement">{movement}</div>
+</body>
+</html>
+"""
+
+
+# Single-page figure (for PDF/PNG output) laying out the rendered images and tables
+def report_page(report, panel_images, movement_image):
+    plots_per_row = 3
+    panel_rows = max(1, math.ceil(len(panel_images) / plots_per_row))
+    tables = [('Plate Discipline', report['plate_discipline']), ('Pitch Traits', report['pitch_traits'])]
+    # Room for each table's header and rows, plus its title
+    table_heights = [0.8 + 0.25 * (1 + (len(table) if table is not None else 0)) for _, table in tables]
+    heights = [3] * panel_rows + table_heights + [5]
+    fig = Figure(figsize=(17, sum(heights) + 1))
+    grid = fig.add_gridspec(len(heights), plots_per_row, height_ratios=heights)
+    fig.suptitle(report['title'], fontsize=20, fontweight='bold')
+
+    for i in range(panel_rows * plots_per_row):
+        ax = fig.add_subplot(grid[i // plots_per_row, i % plots_per_row])
+        ax.axis('off')
+        if i < len(panel_images):
+            ax.imshow(mpimg.imread(io.BytesIO(panel_images[i]), format='png'))
+
+    for row, (name, table) in enumerate(tables):
+        ax = fig.add_subplot(grid[panel_rows + row, :])
+        ax.axis('off')
+        ax.set_title(f"{name}:", loc='left', fontsize=14)
+        if table is not None:
+            formatted = pitch_reports.format_dataframe(table)
+            cells = ax.table(cellText=formatted.astype(str).values, colLabels=list(formatted.columns), loc='upper center')
+            cells.auto_set_font_size(False)
+            cells.set_fontsize(9)
+
+    ax = fig.add_subplot(grid[-1, :])
+    ax.axis('off')
+    ax.set_title("Pitch Movement Graph:", loc='left', fontsize=14)
+    if movement_image:
+        ax.imshow(mpimg.imread(io.BytesIO(movement_image), format='png'))
+    return fig
+
+
+# Compute and write one report; returns (output path, pitches in the selection)
+def build_report(pitcher_name, batter_side, out_dir, fmt, date_filter):
+    report = report_data.report(pitcher_name, batter_side, 'All', 'All', *date_filter)
+    panel_images = [pitch_plots.render_heatmap_panel(*panel) for _, panel in report['heatmap_panels']]
+    movement_image = pitch_plots.render_movement_chart(report['movement']) if len(report['movement']) else None
+
+    path = os.path.join(out_dir, f"{slugify(pitcher_name)}_{batter_side}.{fmt}")
+    if fmt == 'html':
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(report_html(report, panel_images, movement_image))
+    else:
+        fig = report_page(report, panel_images, movement_image)
+        fig.savefig(path, format=fmt, dpi=150)
+    return path, report['pitches']
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate pitcher reports without Streamlit.")
+    parser.add_argument('data', nargs='?', default='OM_OpposingPitchers_2024.csv',
+                        help="TrackMan CSV or directory of per-game CSVs")
+    parser.add_argument('--pitchers', nargs='+', help="Pitchers to report on (default: all)")
+    parser.add_argument('--sides', nargs='+', default=['Right', 'Left'], choices=['Both', 'Right', 'Left'],
+                        help="Batter sides to report on (one report each)")
+    parser.add_argument('--format', default='html', choices=['html', 'pdf', 'png'])
+    parser.add_argument('--start-date', help="Only include games on or after this date (YYYY-MM-DD)")
+    parser.add_argument('--end-date', help="Only include games on or before this date (YYYY-MM-DD)")
+    parser.add_argument('--out', default='reports', help="Output directory")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="Parallel worker processes")
+    args = parser.parse_args(argv)
+
+    global report_data
+    started = time.perf_counter()
+    report_data = pitch_reports.ReportData(args.data)
+    loaded = time.perf_counter()
+
+    if args.start_date or args.end_date:
+        date_filter = ('Date Range', None, args.start_date or '1900-01-01', args.end_date or '2100-12-31')
+    else:
+        date_filter = ('All', None, None, None)
+    pitchers = args.pitchers or report_data.pitchers()
+    jobs = [(pitcher, side, args.out, args.format, date_filter) for pitcher in pitchers for side in args.sides]
+    os.makedirs(args.out, exist_ok=True)
+    print(f"Loaded {report_data.pitches} pitches in {loaded - started:.2f}s; "
+          f"writing {len(jobs)} reports with {args.workers} workers", file=sys.stderr)
+
+    if args.workers <= 1:
+        results = (build_report(*job) for job in jobs)
+    else:
+        # Forked workers share the parent's loaded data and aggregates copy-on-write
+        method = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+        pool = ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context(method),
+                                   initializer=init_worker, initargs=(args.data,))
+        results = (future.result() for future in as_completed([pool.submit(build_report, *job) for job in jobs]))
+
+    for path, pitches in results:
+        print(f"{path} ({pitches} pitches)")
+    if args.workers > 1:
+        pool.shutdown()
+
+    elapsed = time.perf_counter() - loaded
+    print(f"{len(jobs)} reports for {len(pitchers)} pitchers in {elapsed:.2f}s "
+          f"({len(pitchers) / elapsed:.2f} pitchers/s, {len(jobs) / elapsed:.2f} reports/s)", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+import argparse
+import json
+import math
+import os
+import platform
+import shutil
+import statistics
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import pitch_data
+import pitch_plots
+import pitch_reports
+import synthetic_data
+
+# Sidebar selections timed per dataset: (batter side, strikes, balls, date filter)
+selections = [
+    ('Both', 'All', 'All', ('All', None, None, None)),
+    ('Right', 'All', 'All', ('All', None, None, None)),
+    ('Left', 2, 'All', ('All', None, None, None)),
+    ('Both', 'All', 3, ('All', None, None, None)),
+    ('Both', 'All', 'All', ('Date Range', None, '2024-03-01', '2024-04-15')),
+]
+
+# Pitchers sampled per dataset for the per-selection stages
+sampled_pitchers = 10
+
+
+# Median wall time of `repeat` calls to fn()
+def timed(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return statistics.median(times)
+
+
+# Mean wall time per selection of fn(pitcher_name, *filters) over the sampled selections
+def timed_per_selection(fn, pitchers, repeat):
+    runs = [(pitcher, side, strikes, balls) + dates
+            for pitcher in pitchers for side, strikes, balls, dates in selections]
+    return timed(lambda: [fn(*run) for run in runs], repeat) / len(runs)
+
+
+# fn for timed_per_selection that rolls every selection up afresh, so a cube stage
+# isn't timing rollups an earlier stage left in the cube's cache
+def uncached(cube, fn):
+    def run(*filters):
+        cube.rollups.clear()
+        return fn(cube, *filters)
+    return run
+
+
+# Write the synthetic CSV for a dataset size once and reuse it across runs
+def dataset_path(workdir, rows, seed, extra_columns):
+    path = os.path.join(workdir, f"synthetic_{rows}_{seed}_{extra_columns}.csv")
+    if not os.path.exists(path):
+        print(f"Generating {rows} rows -> {path}", file=sys.stderr)
+        synthetic_data.write_pitches(rows, path, seed, extra_columns)
+    return path
+
+
+# Traits table the way the app used to compute it, straight from the filtered pitches
+def traits_groupby(pitcher_data):
+    return pitcher_data.groupby('AutoPitchType', observed=True).agg(
+        Count=('AutoPitchType', 'size'),
+        **{name: (col, 'mean') for name, col in pitch_data.trait_columns.items()}
+    )
+
+
+# The app's original strike zone filter and plate discipline metrics, kept as the
+# reference the cube-backed Plate Discipline table is checked against
+def calculate_in_zone(df):
+    return df[
+        (df['PlateLocHeight'] >= pitch_data.zone_bottom) &
+        (df['PlateLocHeight'] <= pitch_data.zone_top) &
+        (df['PlateLocSide'] >= -pitch_data.zone_half_width) &
+        (df['PlateLocSide'] <= pitch_data.zone_half_width)
+    ]
+
+
+def calculate_metrics(df):
+    in_zone_pitches = calculate_in_zone(df)
+    total_in_zone = len(in_zone_pitches)
+
+    swing_conditions = pitch_data.swing_conditions
+    total_swings = df[df['PitchCall'].isin(swing_conditions)].shape[0]
+    total_whiffs = df[df['PitchCall'] == 'StrikeSwinging'].shape[0]
+    total_chase = df[
+        (~df.index.isin(in_zone_pitches.index)) &
+        df['PitchCall'].isin(swing_conditions)
+    ].shape[0]
+    in_zone_whiffs = in_zone_pitches[in_zone_pitches['PitchCall'] == 'StrikeSwinging'].shape[0]
+    total_strikes = df[df['PitchCall'].isin(pitch_data.strike_conditions)].shape[0]
+
+    return {
+        'InZone%': (total_in_zone / len(df)) * 100 if len(df) > 0 else 'N/A',
+        'Swing%': (total_swings / len(df)) * 100 if len(df) > 0 else 'N/A',
+        'Whiff%': (total_whiffs / total_swings) * 100 if total_swings > 0 else 'N/A',
+        'Chase%': (total_chase / total_swings) * 100 if total_swings > 0 else 'N/A',
+        'InZoneWhiff%': (in_zone_whiffs / total_in_zone) * 100 if total_in_zone > 0 else 'N/A',
+        'Strike%': (total_strikes / len(df)) * 100 if len(df) > 0 else 'N/A'
+    }
+
+
+# Sampled selections whose Plate Discipline table (from the cube) differs from
+# calculate_metrics on each pitch type's filtered pitches; returns [(filters, pitch type, metric)]
+def discipline_mismatches(index, cube, pitchers):
+    found = []
+    for pitcher in pitchers:
+        for side, strikes, balls, dates in selections:
+            filters = (pitcher, side, strikes, balls) + dates
+            table = pitch_reports.plate_discipline_table(cube, *filters)
+            rows = {} if table is None else {row['AutoPitchType']: row for _, row in table.iterrows()}
+            pitcher_data = pitch_data.filter_pitches(index, *filters)
+            for pitch_type, group in pitcher_data.groupby('AutoPitchType', observed=True):
+                if pitch_type not in rows:
+                    found.append((filters, pitch_type, 'Count'))
+                    continue
+                for metric, expected in calculate_metrics(group).items():
+                    actual = rows[pitch_type][metric]
+                    if (expected == 'N/A') != (actual == 'N/A') or \
+                            (expected != 'N/A' and not math.isclose(actual, expected, rel_tol=1e-9, abs_tol=1e-9)):
+                        found.append((filters, pitch_type, metric))
+    return found
+
+
+# Pitchers across the range of workloads, from a Series of pitch counts per pitcher
+def sample_pitchers(counts):
+    counts = counts.sort_values(ascending=False, kind='stable')
+    return list(counts.index[np.linspace(0, len(counts) - 1, min(sampled_pitchers, len(counts))).astype(int)])
+
+
+# Time the stages of a source too large to load whole (see pitch_data.use_chunked_ingest),
+# as the app handles it: the chunked ingest, then each selected pitcher's files and
+# rollups from the partitioned store. Returns ({stage: seconds}, discipline_mismatches).
+def run_partitioned(path, repeat):
+    results = {}
+    shutil.rmtree(pitch_data.partitioned_root(path), ignore_errors=True)
+    results['ingest_chunked'] = timed(lambda: pitch_data.ingest_chunked(path), 1)
+    results['load_store'] = timed(lambda: pitch_data.PartitionedStore(path), repeat)
+    store = pitch_data.PartitionedStore(path)
+    pitchers = sample_pitchers(store.pitch_type_sums['Count'].groupby(level='Pitcher').sum())
+    results['load_partition'] = timed(lambda: [
+        (store.read_partition(pitcher), store.read_pitcher_file('cube', pitcher), store.read_pitcher_file('games', pitcher))
+        for pitcher in pitchers
+    ], repeat) / len(pitchers)
+
+    # Every sampled pitcher's cube at once (the store only keeps partitions_cached of them)
+    cubes = {pitcher: store.cube(pitcher) for pitcher in pitchers}
+    results['discipline_cube'] = timed_per_selection(
+        lambda pitcher, *f: uncached(cubes[pitcher], pitch_reports.plate_discipline_table)(pitcher, *f), pitchers, repeat)
+    results['traits_cube'] = timed_per_selection(
+        lambda pitcher, *f: uncached(cubes[pitcher], pitch_reports.pitch_traits_table)(pitcher, *f), pitchers, repeat)
+    results['trend_games'] = timed(lambda: [store.games(pitcher).games(pitcher) for pitcher in pitchers], repeat) / len(pitchers)
+
+    mismatches = []
+    for pitcher in pitchers:
+        mismatches += discipline_mismatches(store.pitcher_index(pitcher), cubes[pitcher], [pitcher])
+    return results, mismatches
+
+
+# Time every stage for one dataset; returns ({stage: seconds}, discipline_mismatches).
+# Sources above pitch_data.chunked_source_bytes only get the partitioned stages, since
+# the whole-table stages would need the whole (e.g. 10M-row) table in memory.
+def run_dataset(path, repeat, render):
+    if pitch_data.use_chunked_ingest(path):
+        return run_partitioned(path, repeat)
+    results = {}
+
+    # Cold load parses the CSV into the columnar store; warm load only reads the store
+    shutil.rmtree(pitch_data.cache_dir_for(path), ignore_errors=True)
+    results['ingest_csv'] = timed(lambda: pitch_data.ingest_csv(path), 1)
+    results['load_data'] = timed(lambda: pitch_data.add_discipline_flags(pitch_data.load_pitches(path)), repeat)
+    # Mapping the shared prepared table another process already published
+    pitch_data.load_prepared(path)
+    results['load_shared'] = timed(lambda: pitch_data.load_prepared(path), repeat)
+
+    df = pitch_data.add_discipline_flags(pitch_data.load_pitches(path))
+    results['build_index'] = timed(lambda: pitch_data.PitcherIndex(df), repeat)
+    results['build_cube'] = timed(lambda: pitch_data.AggregateCube(df), 1)
+    index = pitch_data.PitcherIndex(df)
+    cube = pitch_data.AggregateCube(df)
+
+    pitchers = sample_pitchers(df['Pitcher'].value_counts())
+
+    def filtered(*filters):
+        return pitch_data.filter_pitches(index, *filters)
+
+    results['filter_data'] = timed_per_selection(filtered, pitchers, repeat)
+    results['discipline_table'] = timed_per_selection(lambda *f: pitch_data.discipline_table(filtered(*f)), pitchers, repeat)
+    results['discipline_cube'] = timed_per_selection(uncached(cube, pitch_reports.plate_discipline_table), pitchers, repeat)
+    results['discipline_staff'] = timed(lambda: pitch_data.discipline_table(df, by=['Pitcher', 'AutoPitchType']), repeat)
+    results['traits_groupby'] = timed_per_selection(lambda *f: traits_groupby(filtered(*f)), pitchers, repeat)
+    results['traits_cube'] = timed_per_selection(uncached(cube, pitch_reports.pitch_traits_table), pitchers, repeat)
+
+    # Game-level rollup: reading the per-file rollups written at ingest, then one pitcher's games
+    results['load_game_rollup'] = timed(lambda: pitch_data.load_game_rollup(path), repeat)
+    games = pitch_data.GameRollup(pitch_data.load_game_rollup(path))
+    results['trend_games'] = timed(lambda: [games.games(pitcher) for pitcher in pitchers], repeat) / len(pitchers)
+
+    # Bounded-memory chunked ingest into the pitcher-partitioned store, then reading one
+    # pitcher's partition, cube cells and games (all the page loads per pitcher from such a store)
+    shutil.rmtree(pitch_data.partitioned_root(path), ignore_errors=True)
+    results['ingest_chunked'] = timed(lambda: pitch_data.ingest_chunked(path), 1)
+    store = pitch_data.PartitionedStore(path)
+    results['load_partition'] = timed(lambda: [
+        (store.read_partition(pitcher), store.read_pitcher_file('cube', pitcher), store.read_pitcher_file('games', pitcher))
+        for pitcher in pitchers
+    ], repeat) / len(pitchers)
+
+    if render:
+        # Rendering is timed for the busiest pitcher with all pitches selected
+        pitcher_data = filtered(pitchers[0], 'Both', 'All', 'All', 'All', None, None, None)
+        plot_data = pitch_reports.heatmap_data(pitcher_data)
+        movement = pitch_reports.movement_data(pitcher_data)
+        results['heatmap_density'] = timed(lambda: pitch_reports.heatmap_panels(plot_data, pitchers[0]), repeat)
+        panels = pitch_reports.heatmap_panels(plot_data, pitchers[0])
+        results['plot_heatmaps'] = timed(lambda: [pitch_plots.render_heatmap_panel(*panel) for _, panel in panels], 1)
+        results['plot_pitch_movement'] = timed(lambda: pitch_plots.render_movement_chart(movement), 1)
+    return results, discipline_mismatches(index, cube, pitchers)
+
+
+# Stages that got slower than the baseline by more than `threshold` (a fraction), ignoring
+# differences below `min_delta` seconds; returns [(rows, stage, baseline, current)]
+def regressions(current, baseline, threshold, min_delta):
+    found = []
+    for rows, stages in current['results'].items():
+        for stage, seconds in stages.items():
+            before = baseline.get('results', {}).get(rows, {}).get(stage)
+            if before is not None and seconds > before * (1 + threshold) and seconds - before > min_delta:
+                found.append((rows, stage, before, seconds))
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data and report pipeline on synthetic TrackMan data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help="Dataset sizes to benchmark (e.g. 10000 ... 10000000)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--extra-columns', type=int, default=150,
+                        help="Filler columns so the CSV is as wide as a real export")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage (median is reported)")
+    parser.add_argument('--no-render', action='store_true', help="Skip the matplotlib stages")
+    parser.add_argument('--workdir', default='.benchmark_data', help="Where synthetic CSVs are kept")
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--baseline', default='benchmark_baseline.json')
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed slowdown vs the baseline (0.25 = 25%%)")
+    parser.add_argument('--min-delta', type=float, default=0.002, help="Ignore slowdowns smaller than this many seconds")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.workdir, exist_ok=True)
+    current = {
+        'meta': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'cpus': os.cpu_count(),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': args.repeat,
+        },
+        'results': {},
+    }
+    mismatches = []
+    for rows in args.rows:
+        path = dataset_path(args.workdir, rows, args.seed, args.extra_columns)
+        results, found = run_dataset(path, args.repeat, not args.no_render)
+        current['results'][str(rows)] = results
+        for stage, seconds in results.items():
+            print(f"{rows:>10} {stage:<22} {seconds * 1000:10.2f} ms")
+        mismatches += [(rows,) + mismatch for mismatch in found]
+
+    # The tables must match the original calculate_metrics before timings mean anything
+    for rows, filters, pitch_type, metric in mismatches:
+        print(f"MISMATCH {rows} {filters} {pitch_type} {metric}: differs from calculate_metrics")
+    if mismatches:
+        return 1
+
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    found = regressions(current, baseline, args.threshold, args.min_delta)
+    for rows, stage, before, seconds in found:
+        print(f"REGRESSION {rows} {stage}: {before * 1000:.2f} ms -> {seconds * 1000:.2f} ms "
+              f"(+{(seconds / before - 1) * 100:.0f}%)")
+    if not found:
+        print(f"No regressions beyond {args.threshold:.0%} of {args.baseline}")
+    return 1 if found else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
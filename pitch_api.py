@@ -0,0 +1,307 @@
+import argparse
+import asyncio
+import json
+import math
+import sys
+from urllib.parse import parse_qsl, urlsplit
+
+import numpy as np
+import pandas as pd
+
+import pitch_data
+import pitch_reports
+
+# Report sections a query can ask for; density grids are large, so they're opt-in
+sections = ['pitch_traits', 'plate_discipline', 'density']
+default_sections = ['pitch_traits', 'plate_discipline']
+
+# Largest request body accepted (bytes)
+max_body_bytes = 1 << 20
+
+status_text = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class QueryError(ValueError):
+    pass
+
+
+# Sidebar-style filters from a query's parameters (same meaning as filter_data's arguments).
+# `date` selects a single date, `start_date`/`end_date` a range (either end may be left
+# open), unless date_filter says otherwise. A JSON query's values are checked for type
+# as well, so e.g. a list or a fractional count is a QueryError rather than a failure
+# further down.
+def query_filters(query):
+    def text(name, default=None):
+        value = query.get(name, default)
+        if value is not None and not isinstance(value, str):
+            raise QueryError(f"'{name}' must be a string")
+        return value
+
+    pitcher_name = text('pitcher')
+    if not pitcher_name:
+        raise QueryError("'pitcher' is required")
+
+    batter_side = text('batter_side', 'Both')
+    if batter_side not in ('Both', 'Right', 'Left'):
+        raise QueryError("'batter_side' must be Both, Right or Left")
+
+    # All, a whole number, or a string of digits (query string parameters)
+    def count(name, values):
+        value = query.get(name, 'All')
+        if value == 'All':
+            return value
+        if isinstance(value, str) and value.isdecimal():
+            value = int(value)
+        elif isinstance(value, bool) or not isinstance(value, int):
+            value = None
+        if value not in values:
+            raise QueryError(f"'{name}' must be All or one of {list(values)}")
+        return value
+
+    strikes = count('strikes', range(3))
+    balls = count('balls', range(4))
+
+    def date(name):
+        value = text(name)
+        if value is None:
+            return None
+        try:
+            return pd.Timestamp(value).date()
+        except (TypeError, ValueError):
+            raise QueryError(f"'{name}' must be a date (YYYY-MM-DD)")
+
+    selected_date, start_date, end_date = date('date'), date('start_date'), date('end_date')
+    date_filter_option = text('date_filter')
+    if date_filter_option is None:
+        if selected_date:
+            date_filter_option = 'Single Date'
+        elif start_date or end_date:
+            date_filter_option = 'Date Range'
+        else:
+            date_filter_option = 'All'
+    if date_filter_option not in ('All', 'Single Date', 'Date Range'):
+        raise QueryError("'date_filter' must be All, Single Date or Date Range")
+
+    return (pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date)
+
+
+# Table rows as JSON objects, with null for missing values ('N/A' in the page)
+def table_records(table):
+    if table is None:
+        return []
+    table = table.astype(object).where(table.notna(), None).replace('N/A', None)
+    return table.to_dict(orient='records')
+
+
+# Heat map density grids per pitch type. Pitch types with too few pitches for a density
+# (fewer than 5) only report their pitch count.
+def density_grids(report):
+    grids = []
+    for pitch_type, (_, x, _, density) in report['heatmap_panels']:
+        grid = {'pitch_type': pitch_type, 'pitches': len(x)}
+        if density is not None:
+            xs, ys, values, levels = density
+            grid.update(x=xs.tolist(), y=ys.tolist(), density=values.tolist(), levels=np.asarray(levels).tolist())
+        grids.append(grid)
+    return grids
+
+
+# Answer one query (a dict of filter parameters plus optional `sections` and
+# `percentiles`) from the prepared report data
+def run_query(data, query):
+    filters = query_filters(query)
+    wanted = query.get('sections', default_sections)
+    if isinstance(wanted, str):
+        wanted = wanted.split(',')
+    if not isinstance(wanted, list) or not all(isinstance(section, str) for section in wanted):
+        raise QueryError("'sections' must be a string or a list of strings")
+    unknown = set(wanted) - set(sections)
+    if unknown:
+        raise QueryError(f"unknown sections {sorted(unknown)}; choose from {sections}")
+    percentiles = str(query.get('percentiles', 'false')).lower() in ('1', 'true', 'yes')
+
+    report = data.report(*filters)
+    result = {
+        'query': dict(zip(['pitcher', 'batter_side', 'strikes', 'balls', 'date_filter', 'date', 'start_date', 'end_date'],
+                          [str(value) if value is not None else None for value in filters])),
+        'pitches': report['pitches'],
+    }
+    for section in ('pitch_traits', 'plate_discipline'):
+        if section in wanted:
+            table = report[section]
+            if percentiles and table is not None:
+                table = pitch_reports.with_percentiles(table, data.ranks)
+            result[section] = table_records(table)
+    if 'density' in wanted:
+        result['density'] = density_grids(report)
+    return result
+
+
+# Encode numpy scalars and turn NaN/inf into null, which plain JSON can't represent
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def json_bytes(payload):
+    def clean(value):
+        if isinstance(value, float) and not math.isfinite(value):
+            return None
+        if isinstance(value, dict):
+            return {key: clean(item) for key, item in value.items()}
+        if isinstance(value, list):
+            return [clean(item) for item in value]
+        return value
+    return json.dumps(clean(payload), default=json_default, separators=(',', ':')).encode()
+
+
+# The HTTP/JSON service. One ReportData (memory-mapped pitch table, index, cube, ranks
+# and caches) serves every request; it is re-prepared when the source data changes,
+# reusing the previous version's aggregates the same way the app does.
+class PitchAPI:
+    def __init__(self, path):
+        self.path = path
+        self.stamp = None
+        self.data = None
+        self._lock = asyncio.Lock()
+
+    # Report data for the current source files, reloaded in a worker thread when they change
+    async def current_data(self):
+        async with self._lock:
+            stamp = pitch_data.source_version(self.path)
+            if stamp != self.stamp:
+                self.data = await asyncio.to_thread(pitch_reports.ReportData, self.path, self.data)
+                self.stamp = stamp
+            return self.data
+
+    # (status, payload) for a request
+    async def handle(self, method, target, body):
+        url = urlsplit(target)
+        params = dict(parse_qsl(url.query))
+
+        if url.path == '/health':
+            data = await self.current_data()
+            return 200, {'status': 'ok', 'version': data.version, 'pitches': data.pitches}
+
+        if url.path == '/pitchers':
+            data = await self.current_data()
+            return 200, {'pitchers': data.pitchers()}
+
+        if url.path != '/query':
+            return 404, {'error': f"unknown path {url.path}"}
+
+        if method == 'GET':
+            queries, batched = [params], False
+        elif method == 'POST':
+            try:
+                payload = json.loads(body or b'{}')
+            except ValueError as e:
+                return 400, {'error': f"invalid JSON: {e}"}
+            batched = isinstance(payload, dict) and 'queries' in payload
+            queries = payload['queries'] if batched else [payload]
+            if not isinstance(queries, list) or not all(isinstance(query, dict) for query in queries):
+                return 400, {'error': "expected a query object or {\"queries\": [query, ...]}"}
+        else:
+            return 405, {'error': "use GET or POST"}
+
+        data = await self.current_data()
+        results = await asyncio.to_thread(self.run_batch, data, queries)
+        if not batched:
+            result = results[0]
+            return (400 if 'error' in result else 200), result
+        return 200, {'results': results}
+
+    # Queries of a batch run one after another (sharing the filter and density caches);
+    # a bad query reports its error without failing the rest. Values that pass validation
+    # but can't be used (e.g. dates at the edge of the representable range) raise
+    # ValueError further down, and are reported the same way.
+    @staticmethod
+    def run_batch(data, queries):
+        results = []
+        for query in queries:
+            try:
+                results.append(run_query(data, query))
+            except ValueError as e:
+                results.append({'error': str(e)})
+        return results
+
+    async def serve_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            try:
+                method, target, _ = request_line.decode('latin-1').split()
+            except ValueError:
+                await self.respond(writer, 400, {'error': "malformed request line"})
+                return
+
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+
+            try:
+                length = int(headers.get('content-length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                await self.respond(writer, 400, {'error': "invalid Content-Length"})
+                return
+            if length > max_body_bytes:
+                await self.respond(writer, 413, {'error': "request body too large"})
+                return
+            body = await reader.readexactly(length) if length else b''
+
+            try:
+                status, payload = await self.handle(method, target, body)
+            except Exception as e:
+                status, payload = 500, {'error': f"{type(e).__name__}: {e}"}
+            await self.respond(writer, status, payload)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def respond(writer, status, payload):
+        body = json_bytes(payload)
+        writer.write(
+            f"HTTP/1.1 {status} {status_text.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode('latin-1') + body
+        )
+        await writer.drain()
+
+
+async def serve(path, host='127.0.0.1', port=8765):
+    api = PitchAPI(path)
+    # Prepare the data before accepting requests
+    await api.current_data()
+    server = await asyncio.start_server(api.serve_connection, host, port)
+    print(f"Serving {path} on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON API over the pitcher report computations.")
+    parser.add_argument('data', nargs='?', default='OM_OpposingPitchers_2024.csv',
+                        help="TrackMan CSV or directory of per-game CSVs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args.data, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
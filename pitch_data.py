@@ -0,0 +1,1536 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:  # no advisory file locks (Windows): old partitioned stores are kept
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.ipc as ipc
+import pyarrow.parquet as pq
+
+# Columns the report functions actually read from the TrackMan export
+numeric_columns = ['RelSpeed', 'SpinRate', 'Tilt', 'RelHeight', 'RelSide',
+                   'Extension', 'InducedVertBreak', 'HorzBreak', 'VertApprAngle', 'ExitSpeed']
+
+report_columns = ['Pitcher', 'Date', 'BatterSide', 'Balls', 'Strikes', 'AutoPitchType',
+                  'PitchCall', 'PlateLocSide', 'PlateLocHeight'] + numeric_columns
+
+# Low-cardinality text columns held as categoricals, and the count columns held as int8
+category_columns = ['Pitcher', 'BatterSide', 'AutoPitchType', 'PitchCall']
+count_columns = ['Balls', 'Strikes']
+
+# Strike zone boundaries (feet), shared with benchmark.calculate_in_zone
+zone_bottom, zone_top = 1.5, 3.3775
+zone_half_width = 0.83083
+
+# Pitch calls that count as a swing / as a strike for the plate discipline metrics
+swing_conditions = ['StrikeSwinging', 'FoulBallFieldable', 'FoulBallNotFieldable', 'InPlay']
+strike_conditions = ['StrikeCalled', 'FoulBallFieldable', 'FoulBallNotFieldable', 'StrikeSwinging', 'InPlay']
+
+# Per-pitch boolean flags derived once at load time; discipline metrics are sums over these
+flag_columns = ['IsInZone', 'IsSwing', 'IsWhiff', 'IsChase', 'IsInZoneWhiff', 'IsStrike']
+
+discipline_columns = ['InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%', 'Strike%']
+
+# Discipline metric -> (numerator, denominator) count columns of its percentage
+discipline_ratios = {
+    'InZone%': ('IsInZone', 'Count'),
+    'Swing%': ('IsSwing', 'Count'),
+    'Whiff%': ('IsWhiff', 'IsSwing'),
+    'Chase%': ('IsChase', 'IsSwing'),
+    'InZoneWhiff%': ('IsInZoneWhiff', 'IsInZone'),
+    'Strike%': ('IsStrike', 'Count'),
+}
+
+# Pitch Traits table columns: output name -> source column (all averaged per pitch type)
+trait_columns = {
+    'RelSpeed': 'RelSpeed',
+    'InducedVertBreak': 'InducedVertBreak',
+    'HorizontalBreak': 'HorzBreak',
+    'SpinRate': 'SpinRate',
+    'RelHeight': 'RelHeight',
+    'RelSide': 'RelSide',
+    'Extension': 'Extension',
+    'VertApprAngle': 'VertApprAngle',
+    'Tilt': 'Tilt',
+    'ExitSpeed': 'ExitSpeed',
+}
+
+# Key under which the source file fingerprint is stored in the Parquet schema metadata
+FINGERPRINT_KEY = b'pitch_data.source'
+
+# Directory (next to the CSV) holding the columnar copies of the source files
+CACHE_DIR_NAME = '.pitch_cache'
+
+
+# Name of the manifest recording which files of a directory source have been ingested
+MANIFEST_NAME = 'manifest.json'
+
+# Directory (inside the cache directory) of the prepared tables shared between processes
+SHARED_DIR_NAME = 'shared'
+
+# Key under which the data version of a shared table is stored in its schema metadata
+VERSION_KEY = b'pitch_data.version'
+
+# Number of shared table versions kept on disk (older ones are deleted when a new one is written)
+shared_versions_kept = 2
+
+# Directory (inside the cache directory) of the pitcher-partitioned stores built by the chunked ingest
+PARTITIONED_DIR_NAME = 'partitioned'
+
+# Description of a partitioned store: version, pitchers, partition files and row count
+PARTITION_INDEX_NAME = 'index.json'
+
+# Season sums per (AutoPitchType, Pitcher) of a partitioned store, for the D1-wide ranks
+PARTITION_SUMS_NAME = 'sums.parquet'
+
+# Lock file of a partitioned store, held shared by every process reading the store so
+# that it is never pruned from under them
+PARTITION_LOCK_NAME = 'readers.lock'
+
+# Layout of a partitioned store's files, part of its directory name so that a store
+# written in an older layout is rebuilt rather than misread
+partition_layout = 3
+
+# Environment variable overriding chunked_source_bytes (0 uses the chunked ingest for every source)
+CHUNKED_ENV = 'PITCH_CHUNKED_BYTES'
+
+# Sources at least this large (total bytes of CSV) are ingested in chunks into a
+# pitcher-partitioned store instead of being loaded whole
+chunked_source_bytes = 2 << 30
+
+# Rows per batch streamed from the source by the chunked ingest
+chunk_rows = 250_000
+
+# Source bytes per spill bucket of the chunked ingest; one bucket is held in memory at a
+# time when the pitcher partitions are written (it holds only the report columns, so it
+# takes far less memory than its share of the CSV)
+bucket_source_bytes = 512 << 20
+
+# Pitcher partitions kept in memory by a partitioned store
+partitions_cached = 8
+
+
+# Cache directory for a source: inside it for a directory of per-game files,
+# next to it for a single CSV
+def cache_dir_for(path):
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return os.path.join(path, CACHE_DIR_NAME)
+    return os.path.join(os.path.dirname(path), CACHE_DIR_NAME)
+
+
+# Name of a source within its cache directory (which every CSV in a folder shares), so
+# each source's shared tables and partitioned stores are kept and pruned on their own
+def source_name(path):
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        return os.path.basename(path)
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+# Path of the columnar store for a given source CSV
+def store_path_for(file_path):
+    name = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(cache_dir_for(file_path), name + '.parquet')
+
+
+# Hash the source file in blocks so large exports don't have to fit in memory
+def file_sha256(file_path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Cheap fingerprint (size + mtime) used to decide whether the hash needs checking
+def source_stat(file_path):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Sidecar of a columnar file recording the source's mtime after it was touched without
+# changing, so the Parquet file doesn't have to be rewritten to update its fingerprint
+def touched_path_for(store_path):
+    return store_path + '.touched'
+
+
+# Read the fingerprint stored with a columnar file, or None if there isn't a usable one.
+# The mtime comes from the touched sidecar when it is for the same contents.
+def read_fingerprint(store_path):
+    if not os.path.exists(store_path):
+        return None
+    try:
+        metadata = pq.read_schema(store_path).metadata or {}
+    except (OSError, pa.ArrowInvalid):
+        return None
+    if FINGERPRINT_KEY not in metadata:
+        return None
+    fingerprint = json.loads(metadata[FINGERPRINT_KEY])
+    try:
+        with open(touched_path_for(store_path)) as f:
+            touched = json.load(f)
+    except (OSError, ValueError):
+        return fingerprint
+    if touched.get('sha256') == fingerprint['sha256'] and touched.get('size') == fingerprint['size']:
+        fingerprint['mtime_ns'] = touched['mtime_ns']
+    return fingerprint
+
+
+# Record the source's current size/mtime for a columnar file whose contents it still matches
+def record_touched(store_path, fingerprint, stat):
+    path = touched_path_for(store_path)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dict(stat, sha256=fingerprint['sha256']), f)
+    os.replace(tmp_path, path)
+
+
+# Check whether the columnar store still matches the source CSV.
+# Size + mtime is checked first; the hash only runs if the file was touched, and a
+# touched file with unchanged contents has its new mtime recorded so it is hashed once.
+def store_is_current(file_path, store_path):
+    fingerprint = read_fingerprint(store_path)
+    if fingerprint is None:
+        return False
+    stat = source_stat(file_path)
+    if stat['size'] != fingerprint['size']:
+        return False
+    if stat['mtime_ns'] == fingerprint['mtime_ns']:
+        return True
+    if file_sha256(file_path) != fingerprint['sha256']:
+        return False
+    record_touched(store_path, fingerprint, stat)
+    return True
+
+
+# Parse the CSV once and write it out as a typed Parquet file
+def ingest_csv(file_path, store_path=None):
+    store_path = store_path or store_path_for(file_path)
+    fingerprint = dict(source_stat(file_path), sha256=file_sha256(file_path))
+
+    df = pd.read_csv(file_path, parse_dates=['Date'], low_memory=False)
+
+    # Coerce non-numeric values to NaN so the measurement columns are stored as floats
+    for col in numeric_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce')
+
+    # Mixed-type text columns can't be written to Parquet as-is
+    for col in df.columns[df.dtypes == object]:
+        df[col] = df[col].where(df[col].isna(), df[col].astype(str))
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FINGERPRINT_KEY] = json.dumps(fingerprint).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    # Write to a temp file and rename so readers never see a half-written store
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, store_path)
+    try:
+        os.remove(touched_path_for(store_path))
+    except OSError:
+        pass
+
+    # The game-level rollup is computed while the parsed table is at hand
+    write_game_rollup(store_path, game_cells(df), fingerprint)
+    return store_path
+
+
+# Source CSVs of a directory of per-game exports, in name order
+def source_files(directory):
+    return sorted(entry.name for entry in os.scandir(directory)
+                  if entry.is_file() and entry.name.lower().endswith('.csv'))
+
+
+# Path of the manifest of a directory of per-game CSVs
+def manifest_path_for(directory):
+    return os.path.join(cache_dir_for(directory), MANIFEST_NAME)
+
+
+def read_manifest(directory):
+    try:
+        with open(manifest_path_for(directory)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(directory, manifest):
+    path = manifest_path_for(directory)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Bring the columnar store of a directory of per-game CSVs up to date. Each CSV gets
+# its own Parquet part; only new or changed files are parsed, and parts of deleted
+# files are dropped. The manifest records path, size, mtime, hash, row count and the
+# pitchers in each file. Returns (manifest, names of files added/changed/removed).
+def ingest_directory(directory):
+    parts_dir = os.path.join(cache_dir_for(directory), 'parts')
+    os.makedirs(parts_dir, exist_ok=True)
+    manifest = read_manifest(directory)
+    current = source_files(directory)
+    changed = set(manifest) - set(current)
+
+    for name in current:
+        file_path = os.path.join(directory, name)
+        part_path = os.path.join(parts_dir, os.path.splitext(name)[0] + '.parquet')
+        entry = manifest.get(name)
+        stat = source_stat(file_path)
+        if entry and entry['size'] == stat['size'] and entry['mtime_ns'] == stat['mtime_ns'] \
+                and os.path.exists(part_path):
+            continue
+        if not store_is_current(file_path, part_path):
+            ingest_csv(file_path, part_path)
+        fingerprint = read_fingerprint(part_path)
+        if entry and entry['sha256'] == fingerprint['sha256']:
+            # Touched but unchanged: only the recorded mtime moves
+            entry.update(mtime_ns=stat['mtime_ns'])
+            continue
+
+        pitchers = pq.read_table(part_path, columns=['Pitcher']).column('Pitcher')
+        manifest[name] = dict(
+            fingerprint,
+            path=os.path.abspath(file_path),
+            part=os.path.basename(part_path),
+            rows=len(pitchers),
+            pitchers=sorted(p for p in pitchers.unique().to_pylist() if p is not None),
+        )
+        changed.add(name)
+
+    for name in set(manifest) - set(current):
+        part_path = os.path.join(parts_dir, manifest.pop(name)['part'])
+        for stale_path in (part_path, touched_path_for(part_path), game_rollup_path_for(part_path)):
+            try:
+                os.remove(stale_path)
+            except OSError:
+                pass
+
+    write_manifest(directory, manifest)
+    return manifest, changed
+
+
+# Read the given columns from a Parquet file, skipping any the file doesn't have.
+# Text columns in category_columns come back dictionary-encoded (as categoricals),
+# so their strings are never materialized one per row.
+def read_columns(path, columns):
+    available = set(pq.read_schema(path).names)
+    columns = [col for col in columns if col in available]
+    dictionary = [col for col in category_columns if col in columns]
+    return pq.read_table(path, columns=columns, read_dictionary=dictionary).to_pandas()
+
+
+# Shrink a pitch table in place: categoricals (with sorted categories) for the text
+# columns in category_columns, float32 for the measurement columns and int8 for
+# Balls/Strikes. Plate locations stay float64 so the strike zone flags are unchanged.
+def compact_pitches(df):
+    for col in category_columns:
+        if col not in df.columns:
+            continue
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            # Parts of a directory source may each have their own categories
+            df[col] = df[col].cat.set_categories(sorted(df[col].cat.categories))
+        else:
+            df[col] = df[col].astype('category')
+    for col in numeric_columns:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(np.float32)
+    for col in count_columns:
+        if col in df.columns:
+            values = pd.to_numeric(df[col], errors='coerce')
+            # A count with missing values can't be an int8; keep those as float32
+            df[col] = values.astype(np.int8) if values.notna().all() else values.astype(np.float32)
+    return df
+
+
+# Deep memory use per column (MB) of each of the given tables, plus a total row,
+# e.g. memory_report(before=full_df, after=compact_df)
+def memory_report(**frames):
+    report = pd.DataFrame({name: df.memory_usage(index=False, deep=True) / 1e6 for name, df in frames.items()})
+    report.loc['Total'] = report.sum()
+    return report.round(2)
+
+
+# Bring the columnar store of a CSV or directory of per-game CSVs up to date,
+# parsing only new or changed files. Returns the store's path (the manifest of a
+# directory's per-file stores).
+def update_store(path):
+    if os.path.isdir(path):
+        ingest_directory(path)
+        return manifest_path_for(path)
+    store_path = store_path_for(path)
+    if not store_is_current(path, store_path):
+        ingest_csv(path, store_path)
+    return store_path
+
+
+# Load the pitch data from a CSV or a directory of per-game CSVs, (re-)ingesting only
+# what has changed. Only the requested columns are read from the columnar store, and
+# the result uses the compact dtypes from compact_pitches.
+def load_pitches(path, columns=report_columns):
+    update_store(path)
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        parts_dir = os.path.join(cache_dir_for(path), 'parts')
+        frames = [read_columns(os.path.join(parts_dir, manifest[name]['part']), columns)
+                  for name in sorted(manifest)]
+        if not frames:
+            return pd.DataFrame(columns=columns)
+        return compact_pitches(pd.concat(frames, ignore_index=True))
+
+    return compact_pitches(read_columns(store_path_for(path), columns))
+
+
+# Path of the shared prepared table for one data version of a source (each source in
+# a folder has its own directory, so its versions are pruned without touching others')
+def shared_table_path(path, version):
+    return os.path.join(cache_dir_for(path), SHARED_DIR_NAME, source_name(path), f'{version}.arrow')
+
+
+# Arrow array for a column of a prepared table, laid out so that reading it back into
+# pandas from a memory map needs no copy: floats keep NaN as a value (no null bitmap),
+# booleans are stored as uint8 (Arrow packs bools into bits) and categoricals as
+# dictionary arrays over their codes
+def shared_column(column):
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()
+        return pa.DictionaryArray.from_arrays(pa.array(codes, mask=codes < 0),
+                                              pa.array(column.cat.categories.astype(object)))
+    values = column.to_numpy()
+    if values.dtype == np.bool_:
+        return pa.array(values.view(np.uint8))
+    if values.dtype.kind in 'fiuM':
+        return pa.array(values)
+    return pa.array(column, from_pandas=True)
+
+
+# Write a prepared table as an uncompressed Arrow IPC file that processes can memory-map.
+# Written under a temp name and renamed, so readers only ever see a complete file; the
+# source's older versions beyond shared_versions_kept are removed (processes still mapping one keep
+# their mapping on POSIX systems). `pitchers` (names in display order) is stored alongside.
+def write_shared_table(df, path, version, pitchers=()):
+    shared_path = shared_table_path(path, version)
+    os.makedirs(os.path.dirname(shared_path), exist_ok=True)
+    table = pa.table({col: shared_column(df[col]) for col in df.columns})
+    flags = [col for col in df.columns if df[col].dtype == np.bool_]
+    table = table.replace_schema_metadata({
+        VERSION_KEY: version.encode(),
+        b'pitch_data.bool': json.dumps(flags).encode(),
+        b'pitch_data.pitchers': json.dumps(list(pitchers)).encode(),
+    })
+
+    tmp_path = f"{shared_path}.{os.getpid()}-{threading.get_ident()}.tmp"
+    with pa.OSFile(tmp_path, 'wb') as sink:
+        with ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(tmp_path, shared_path)
+
+    directory = os.path.dirname(shared_path)
+    tables = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(directory) if entry.name.endswith('.arrow'))
+    for _, old_path in tables[:-shared_versions_kept]:
+        if old_path != shared_path:
+            try:
+                os.remove(old_path)
+            except OSError:
+                pass
+    return shared_path
+
+
+# Memory-map the shared table for a data version as a read-only DataFrame whose columns
+# point into the mapped file (so every process shares one copy in the page cache).
+# Returns (df, pitchers), or None if there is no complete table for that version.
+def open_shared_table(path, version):
+    try:
+        source = pa.memory_map(shared_table_path(path, version))
+        table = ipc.open_file(source).read_all()
+    except (OSError, pa.ArrowInvalid):
+        return None
+    metadata = table.schema.metadata or {}
+    if metadata.get(VERSION_KEY) != version.encode():
+        return None
+    flags = json.loads(metadata.get(b'pitch_data.bool', b'[]'))
+    columns = {}
+    for name, column in zip(table.column_names, table.columns):
+        values = column.to_pandas(split_blocks=True)
+        columns[name] = values.to_numpy().view(np.bool_) if name in flags else values.array
+    return pd.DataFrame(columns, copy=False), json.loads(metadata.get(b'pitch_data.pitchers', b'[]'))
+
+
+# Pitch table ready for the reports: typed, compacted, with discipline flags, sorted by
+# (Pitcher, Date). Returns (df, pitchers in the order they first appear in the data).
+def prepare_pitches(path):
+    df = add_discipline_flags(load_pitches(path))
+    pitchers = [str(pitcher) for pitcher in df['Pitcher'].dropna().unique()]
+    return PitcherIndex(df).df, pitchers
+
+
+# The prepare_pitches table, published as a shared memory-mapped table for the current
+# data version; reuses the one another process already wrote for that version.
+# Returns (df, version, pitchers).
+def load_prepared(path):
+    update_store(path)
+    version = data_version(path)
+    if version is None:
+        df, pitchers = prepare_pitches(path)
+        return df, version, pitchers
+    shared = open_shared_table(path, version)
+    if shared is None:
+        prepared, pitchers = prepare_pitches(path)
+        write_shared_table(prepared, path, version, pitchers)
+        # Use the mapped copy from here on, so this process doesn't hold a private one
+        shared = open_shared_table(path, version) or (prepared, pitchers)
+    df, pitchers = shared
+    return df, version, pitchers
+
+
+# Cheap stamp of the source files (names, sizes, mtimes) without reading them; changes
+# whenever a file is added, removed or modified, so it can key caches of loaded data
+def source_version(path):
+    if os.path.isdir(path):
+        files = [(name,) + tuple(source_stat(os.path.join(path, name)).values()) for name in source_files(path)]
+    else:
+        files = [tuple(source_stat(path).values())]
+    return hashlib.sha256(repr(files).encode()).hexdigest()[:16]
+
+
+# Short identifier for the data currently in the columnar store (changes whenever the data does)
+def data_version(path):
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        return hashlib.sha256(repr(sorted((name, entry['sha256']) for name, entry in manifest.items())).encode()).hexdigest()[:16]
+    fingerprint = read_fingerprint(store_path_for(path))
+    return fingerprint['sha256'][:16] if fingerprint else None
+
+
+# Per-pitcher data versions for a directory source: each pitcher's version only changes
+# when a file containing their pitches does, so caches keyed on it survive new games
+# for everyone else. Empty for a single CSV (every pitcher shares the data version).
+def pitcher_versions(path):
+    if not os.path.isdir(path):
+        return {}
+    files = {}
+    for name, entry in sorted(read_manifest(path).items()):
+        for pitcher in entry['pitchers']:
+            files.setdefault(pitcher, []).append((name, entry['sha256']))
+    return {pitcher: hashlib.sha256(repr(entries).encode()).hexdigest()[:16] for pitcher, entries in files.items()}
+
+
+# Add the plate discipline flag columns (same definitions as benchmark.calculate_metrics)
+def add_discipline_flags(df):
+    height, side = df['PlateLocHeight'], df['PlateLocSide']
+    in_zone = (height >= zone_bottom) & (height <= zone_top) & (side >= -zone_half_width) & (side <= zone_half_width)
+    swing = df['PitchCall'].isin(swing_conditions)
+    whiff = df['PitchCall'] == 'StrikeSwinging'
+
+    df['IsInZone'] = in_zone
+    df['IsSwing'] = swing
+    df['IsWhiff'] = whiff
+    df['IsChase'] = ~in_zone & swing
+    df['IsInZoneWhiff'] = in_zone & whiff
+    df['IsStrike'] = df['PitchCall'].isin(strike_conditions)
+    return df
+
+
+# Pitch count and flag totals per group, in a single groupby pass
+def discipline_counts(df, by):
+    counts = df.groupby(by, observed=True)[flag_columns].sum()
+    counts.insert(0, 'Count', df.groupby(by, observed=True).size())
+    return counts
+
+
+# Percentages from discipline_counts as {metric: array}, with 'N/A' where the
+# denominator is zero (matches benchmark.calculate_metrics). Computed on arrays; a
+# metric stays float unless it has an 'N/A'.
+def discipline_metrics(counts):
+    numerators = counts[[numerator for numerator, _ in discipline_ratios.values()]].to_numpy(dtype=np.float64)
+    denominators = counts[[denominator for _, denominator in discipline_ratios.values()]].to_numpy(dtype=np.float64)
+    valid = denominators > 0
+    percents = numerators / np.where(valid, denominators, 1) * 100
+
+    metrics = {}
+    for i, name in enumerate(discipline_ratios):
+        metrics[name] = percents[:, i] if valid[:, i].all() else np.where(valid[:, i], percents[:, i].astype(object), 'N/A')
+    return metrics
+
+
+# Plate discipline table from per-group counts (Count + flag totals), built in one go
+# from arrays. `totals` is the number of pitches Pitch% is relative to (a scalar, or one
+# value per row of counts).
+def discipline_table_from_counts(counts, totals):
+    n = counts['Count'].to_numpy()
+    table = {name: counts.index.get_level_values(name) for name in counts.index.names}
+    table.update({'Count': n, 'Pitch%': n / totals * 100})
+    table.update(discipline_metrics(counts))
+    return pd.DataFrame(table)
+
+
+# Plate discipline table grouped by `by` (e.g. ['AutoPitchType'], or ['Pitcher', 'AutoPitchType']
+# for a whole staff at once). Pitch% is relative to all pitches of the outer group.
+def discipline_table(df, by=('AutoPitchType',)):
+    by = list(by)
+    counts = discipline_counts(df, by)
+    if len(by) > 1:
+        totals = df.groupby(by[:-1], observed=True).size().reindex(counts.index.droplevel(-1)).to_numpy()
+    else:
+        totals = len(df)
+    return discipline_table_from_counts(counts, totals)
+
+
+# Pitch table sorted by (Pitcher, Date) with the row range of every pitcher, so
+# selecting a pitcher and a date window is a slice instead of a full-table scan
+class PitcherIndex:
+    # `is_sorted` means df is already in index order (e.g. a prepared table from
+    # load_prepared) and is used as is, without a copy
+    def __init__(self, df, version=None, pitcher_versions=None, is_sorted=False):
+        self.version = version
+        self.pitcher_versions = pitcher_versions or {}
+        if is_sorted:
+            self.df = df
+        else:
+            df = df[df['Pitcher'].notna()]
+            self.df = df.sort_values(['Pitcher', 'Date'], kind='stable').reset_index(drop=True)
+
+        # Rows are grouped by pitcher after the sort, so each pitcher is one [start, stop) range
+        pitchers = self.df['Pitcher'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, pitchers[1:] != pitchers[:-1]])[:len(pitchers)]
+        stops = np.r_[starts[1:], len(pitchers)]
+        self.offsets = {pitchers[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+        # Dates are sorted within each pitcher's range (NaT last), so bounds come from searchsorted
+        self.dates = self.df['Date'].to_numpy()
+        self.batter_side, self.side_codes = category_codes(self.df['BatterSide'])
+        self.balls = self.df['Balls'].to_numpy()
+        self.strikes = self.df['Strikes'].to_numpy()
+
+    # Row range for a pitcher, optionally narrowed to dates in [start_date, end_date)
+    def rows(self, pitcher_name, start_date=None, end_date=None):
+        start, stop = self.offsets.get(pitcher_name, (0, 0))
+        dates = self.dates[start:stop]
+        lo = np.searchsorted(dates, start_date, side='left') if start_date is not None else 0
+        hi = np.searchsorted(dates, end_date, side='left') if end_date is not None else len(dates)
+        return start + lo, start + max(lo, hi)
+
+    # Version of one pitcher's data, for cache keys (falls back to the whole dataset's)
+    def key_version(self, pitcher_name):
+        return self.pitcher_versions.get(pitcher_name, self.version)
+
+    # Code of a BatterSide value in self.batter_side (-2, matching no row, if it never occurs)
+    def side_code(self, batter_side):
+        return self.side_codes.get(batter_side, -2)
+
+
+# Integer codes of a column (as a categorical) and a lookup from value to code, so
+# equality filters compare small integers instead of strings. Missing values are -1.
+def category_codes(column):
+    column = column.astype('category')
+    return column.cat.codes.to_numpy(), {value: code for code, value in enumerate(column.cat.categories)}
+
+
+# Date window [start, end) for the sidebar date filter, or (None, None) for no date filter.
+# A date range may leave either end open (None).
+def date_bounds(date_filter_option, selected_date, start_date, end_date):
+    if date_filter_option == "Single Date" and selected_date:
+        day = pd.Timestamp(selected_date).normalize()
+        return day.to_datetime64(), (day + pd.Timedelta(days=1)).to_datetime64()
+    elif date_filter_option == "Date Range" and (start_date or end_date):
+        start = pd.Timestamp(start_date).to_datetime64() if start_date else None
+        # The range is inclusive of end_date itself (Date <= end_date)
+        end = (pd.Timestamp(end_date) + pd.Timedelta(1, 'ns')).to_datetime64() if end_date else None
+        return start, end
+    return None, None
+
+
+# Filter the indexed pitch table on the sidebar selections: slice out the pitcher's
+# date window, then apply BatterSide/Strikes/Balls as one fused mask
+def filter_pitches(index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
+    lo, hi = index.rows(pitcher_name, *date_bounds(date_filter_option, selected_date, start_date, end_date))
+
+    sides = index.batter_side[lo:hi]
+    if batter_side == 'Both':
+        mask = (sides == index.side_code('Right')) | (sides == index.side_code('Left'))
+    else:
+        mask = sides == index.side_code(batter_side)
+    if strikes != 'All':
+        mask &= index.strikes[lo:hi] == strikes
+    if balls != 'All':
+        mask &= index.balls[lo:hi] == balls
+
+    return index.df.iloc[lo:hi][mask]
+
+
+# Cache key for a filter selection. Date inputs are reduced to the window they select,
+# so e.g. a stale date picker value doesn't matter when the date filter is "All".
+def filter_key(index, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
+    return (index.key_version(pitcher_name), pitcher_name, batter_side, strikes, balls) + \
+        date_bounds(date_filter_option, selected_date, start_date, end_date)
+
+
+# Bounded LRU cache of computed results (filtered subsets, tables, ...), shared
+# between report sections and sessions. Cached values must be treated as read-only.
+class LRUCache:
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, compute):
+        found, value = self.lookup(key)
+        if not found:
+            # Compute outside the lock so a slow miss doesn't block other sessions
+            value = compute()
+            self.put(key, value)
+        return value
+
+    # (True, value) on a hit, (False, None) on a miss
+    def lookup(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+# Sufficient statistics kept per cube cell: pitch count, discipline flag counts and,
+# for each measurement column, its non-null count and sum. Cells store counts as int32
+# and sums as float32; running totals keep counts in int32 and sums in float64, as a
+# float32 difference of two large running sums would lose a short date window.
+cube_count_columns = ['Count'] + flag_columns
+cube_stat_columns = cube_count_columns + [
+    f'{col}_{stat}' for col in numeric_columns for stat in ('n', 'sum')
+]
+cube_integer_columns = [col for col in cube_stat_columns if not col.endswith('_sum')]
+cube_sum_columns = [col for col in cube_stat_columns if col.endswith('_sum')]
+
+# Series of cube cells share (Pitcher, BatterSide, Balls, Strikes, AutoPitchType) and run over game days
+cube_series_keys = ['Pitcher', 'BatterSide', 'Balls', 'Strikes', 'AutoPitchType']
+
+# Day number used for pitches without a Date (sorts after every real game day)
+undated_day = 2 ** 31 - 1
+
+
+# Whole days since the epoch for the start of the first day at or after `value`
+def ceil_day(value):
+    return (pd.Timestamp(value).ceil('D') - pd.Timestamp(0)) // pd.Timedelta(days=1)
+
+
+# Cube cells for a pitch table: one row of summed statistics per (Pitcher, BatterSide,
+# Balls, Strikes, AutoPitchType, game day), sorted by those keys
+def cube_cells(df):
+    df = df[df['Pitcher'].notna()]
+
+    days = df['Date'].to_numpy().astype('datetime64[D]')
+    stats = {'Day': np.where(np.isnat(days), undated_day, days.astype(np.int64))}
+    for key in cube_series_keys:
+        stats[key] = df[key].to_numpy()
+    stats['Count'] = np.ones(len(df), dtype=np.int32)
+    for col in flag_columns:
+        stats[col] = df[col].to_numpy(dtype=np.int32)
+    for col in numeric_columns:
+        values = df[col].to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        stats[f'{col}_n'] = present.astype(np.int32)
+        stats[f'{col}_sum'] = np.where(present, values, 0.0)
+
+    cells = (
+        pd.DataFrame(stats)
+        .groupby(cube_series_keys + ['Day'], dropna=False, sort=True, observed=True)[cube_stat_columns].sum()
+        .reset_index()
+    )
+    # Sums are accumulated in float64 and only stored as float32
+    return cells.astype({**dict.fromkeys(cube_integer_columns, np.int32), **dict.fromkeys(cube_sum_columns, np.float32)})
+
+
+# Pre-aggregated sufficient statistics per (Pitcher, BatterSide, Balls, Strikes, game Date,
+# AutoPitchType), with running totals over game dates within each series of cells.
+# Any sidebar selection is a rollup over that pitcher's cells, and a date window costs
+# two prefix-sum lookups per series instead of a scan over raw pitches. The last
+# `rollups_cached` rollups are kept, so the tables of one selection share a rollup.
+class AggregateCube:
+    rollups_cached = 64
+
+    def __init__(self, df=None, version=None, pitcher_versions=None, cells=None):
+        self.version = version
+        self.pitcher_versions = pitcher_versions or {}
+        self.cells = cube_cells(df) if cells is None else cells
+        self.rollups = LRUCache(self.rollups_cached)
+
+        # Cells are sorted by every key, so each series is contiguous and ordered by day
+        series = self.cells.groupby(cube_series_keys, dropna=False, sort=False, observed=True).ngroup().to_numpy()
+        self.count_prefix = self.cells[cube_integer_columns].groupby(series).cumsum().to_numpy(dtype=np.int32)
+        self.sum_prefix = self.cells[cube_sum_columns].astype(np.float64).groupby(series).cumsum().to_numpy()
+
+        # (series, day) packed into one sorted int64 so every series can be searched at once
+        self.cell_keys = (series.astype(np.int64) << 32) | self.cells['Day'].to_numpy(dtype=np.int64)
+
+        self.series_start = np.flatnonzero(np.r_[True, series[1:] != series[:-1]])[:len(series)]
+        heads = self.cells.iloc[self.series_start]
+        self.series_side = heads['BatterSide'].to_numpy()
+        self.series_balls = heads['Balls'].to_numpy()
+        self.series_strikes = heads['Strikes'].to_numpy()
+        # Pitch type of each series as a code into the sorted pitch types (NaN last)
+        self.series_type_code, self.pitch_types = pd.factorize(
+            heads['AutoPitchType'].to_numpy(dtype=object), sort=True, use_na_sentinel=False
+        )
+
+        pitchers = heads['Pitcher'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, pitchers[1:] != pitchers[:-1]])[:len(pitchers)]
+        stops = np.r_[starts[1:], len(pitchers)]
+        self.offsets = {pitchers[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+    # Cube for a new version of the data, re-aggregating only the pitchers whose
+    # per-pitcher version changed. Without per-pitcher versions it is rebuilt in full.
+    def refreshed(self, df, version, pitcher_versions):
+        if not self.pitcher_versions or not pitcher_versions:
+            return AggregateCube(df, version, pitcher_versions)
+
+        changed = {pitcher for pitcher in set(self.pitcher_versions) | set(pitcher_versions)
+                   if self.pitcher_versions.get(pitcher) != pitcher_versions.get(pitcher)}
+        kept = self.cells[~self.cells['Pitcher'].isin(changed)]
+        updated = cube_cells(df[df['Pitcher'].isin(changed)])
+        cells = (
+            pd.concat([kept, updated], ignore_index=True)
+            .sort_values(cube_series_keys + ['Day'], kind='stable', na_position='last')
+            .reset_index(drop=True)
+        )
+        return AggregateCube(version=version, pitcher_versions=pitcher_versions, cells=cells)
+
+    # Summed statistics per AutoPitchType for a sidebar selection (same filter semantics
+    # as filter_pitches). Pitches without an AutoPitchType are kept under a NaN key.
+    # The result is shared between callers and must not be modified.
+    def rollup(self, pitcher_name, batter_side, strikes, balls, date_filter_option, selected_date, start_date, end_date):
+        dates = date_bounds(date_filter_option, selected_date, start_date, end_date)
+        key = (pitcher_name, batter_side, strikes, balls) + dates
+        return self.rollups.get(key, lambda: self.compute_rollup(pitcher_name, batter_side, strikes, balls, *dates))
+
+    def compute_rollup(self, pitcher_name, batter_side, strikes, balls, start, end):
+        lo, hi = self.offsets.get(pitcher_name, (0, 0))
+        sides = self.series_side[lo:hi]
+        if batter_side == 'Both':
+            mask = (sides == 'Right') | (sides == 'Left')
+        else:
+            mask = sides == batter_side
+        if strikes != 'All':
+            mask &= self.series_strikes[lo:hi] == strikes
+        if balls != 'All':
+            mask &= self.series_balls[lo:hi] == balls
+        ids = np.arange(lo, hi)[mask].astype(np.int64)
+
+        first_day = ceil_day(start) if start is not None else 0
+        end_day = ceil_day(end) if end is not None else undated_day + 1
+
+        # Last cell before end_day minus last cell before first_day, per series
+        series_start = self.series_start[ids]
+        upper = np.searchsorted(self.cell_keys, (ids << 32) | end_day, side='left') - 1
+        lower = np.searchsorted(self.cell_keys, (ids << 32) | first_day, side='left') - 1
+        has_upper = (upper >= series_start)[:, None]
+        has_lower = (lower >= series_start)[:, None]
+
+        # Window totals per series, then summed per pitch type code
+        codes = self.series_type_code[ids]
+        counts = np.zeros((len(self.pitch_types), len(cube_integer_columns)), dtype=np.int64)
+        sums = np.zeros((len(self.pitch_types), len(cube_sum_columns)), dtype=np.float64)
+        np.add.at(counts, codes, np.where(has_upper, self.count_prefix[upper], 0) - np.where(has_lower, self.count_prefix[lower], 0))
+        np.add.at(sums, codes, np.where(has_upper, self.sum_prefix[upper], 0.0) - np.where(has_lower, self.sum_prefix[lower], 0.0))
+
+        thrown = counts[:, 0] > 0
+        columns = dict(zip(cube_integer_columns, counts[thrown].T))
+        columns.update(zip(cube_sum_columns, sums[thrown].T))
+        return pd.DataFrame({col: columns[col] for col in cube_stat_columns},
+                            index=pd.Index(self.pitch_types[thrown], name='AutoPitchType'))
+
+
+# Mean of each trait from summed cube statistics (one row per group), NaN where a
+# trait has no values. Computed as one array rather than column by column.
+def trait_means(sums):
+    n = sums[[f'{col}_n' for col in trait_columns.values()]].to_numpy(dtype=np.float64)
+    total = sums[[f'{col}_sum' for col in trait_columns.values()]].to_numpy(dtype=np.float64)
+    means = np.divide(total, n, out=np.full(n.shape, np.nan), where=n > 0)
+    return pd.DataFrame(means, index=sums.index, columns=list(trait_columns))
+
+
+# Pitch Traits table (Count and mean of each trait per pitch type) from a cube rollup
+def traits_table_from_rollup(rolled):
+    rolled = rolled[rolled.index.notna()]
+    table = trait_means(rolled)
+    table.insert(0, 'Count', rolled['Count'])
+    # ExitSpeed is only recorded on balls in play; show N/A rather than NaN when there are none
+    table['ExitSpeed'] = table['ExitSpeed'].where(rolled['ExitSpeed_n'] > 0, 'N/A')
+    return table.rename_axis('AutoPitchType').reset_index()
+
+
+# Plate discipline table from a cube rollup; Pitch% counts pitches without an AutoPitchType too
+def discipline_table_from_rollup(rolled):
+    total = rolled['Count'].sum()
+    return discipline_table_from_counts(rolled[rolled.index.notna()], total)
+
+
+# Metrics given D1-wide percentile ranks (Tilt is a clock string, so it has no numeric mean)
+percentile_metrics = [name for name in trait_columns if name != 'Tilt'] + discipline_columns
+
+# Metrics ranked by magnitude, since their sign depends on the pitcher's handedness
+magnitude_metrics = ['HorizontalBreak', 'RelSide']
+
+
+# Trait means and discipline percentages from summed cube statistics (one row per group),
+# as floats with NaN where a metric is undefined
+def rollup_metrics(sums):
+    def percent(numerator, denominator):
+        return (numerator / denominator * 100).where(denominator > 0)
+
+    metrics = trait_means(sums)
+    n, swings, in_zone = sums['Count'], sums['IsSwing'], sums['IsInZone']
+    metrics['InZone%'] = percent(in_zone, n)
+    metrics['Swing%'] = percent(swings, n)
+    metrics['Whiff%'] = percent(sums['IsWhiff'], swings)
+    metrics['Chase%'] = percent(sums['IsChase'], swings)
+    metrics['InZoneWhiff%'] = percent(sums['IsInZoneWhiff'], in_zone)
+    metrics['Strike%'] = percent(sums['IsStrike'], n)
+    return metrics
+
+
+# Summed statistics of cube cells for every (AutoPitchType, Pitcher) over all of the
+# data, accumulated in float64 like the cube's running totals so a season rollup
+# matches them
+def pitch_type_sums(cells):
+    cells = cells.astype(dict.fromkeys(cube_sum_columns, np.float64))
+    return cells.groupby(['AutoPitchType', 'Pitcher'], observed=True)[cube_stat_columns].sum()
+
+
+# Distribution of every pitcher's season metrics per AutoPitchType, for percentile
+# ranks, from the per-(AutoPitchType, Pitcher) sums of pitch_type_sums. Each metric is
+# held as one array sorted by (pitch type, value), with the slice of each pitch type,
+# so a rank is two searchsorted calls. Pitchers with fewer than `min_pitches` of a
+# pitch type are left out of its distribution.
+class PercentileRanks:
+    def __init__(self, sums, min_pitches=20):
+        sums = sums[sums['Count'] >= min_pitches]
+        metrics = rollup_metrics(sums)
+        metrics[magnitude_metrics] = metrics[magnitude_metrics].abs()
+        pitch_types = metrics.index.get_level_values('AutoPitchType').to_numpy()
+
+        self.values = {}
+        self.offsets = {}
+        for metric in percentile_metrics:
+            values = metrics[metric].to_numpy(dtype=np.float64)
+            present = ~np.isnan(values)
+            types, values = pitch_types[present], values[present]
+            order = np.lexsort((values, types))
+            types, values = types[order], values[order]
+            starts = np.flatnonzero(np.r_[True, types[1:] != types[:-1]])[:len(types)]
+            stops = np.r_[starts[1:], len(types)]
+            self.values[metric] = values
+            self.offsets[metric] = {types[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+    # Percentile (0-100) of `value` among pitchers throwing `pitch_type`, counting ties
+    # as half below; NaN if the value or the distribution is missing
+    def percentile(self, pitch_type, metric, value):
+        start, stop = self.offsets[metric].get(pitch_type, (0, 0))
+        if stop == start or pd.isna(value):
+            return np.nan
+        if metric in magnitude_metrics:
+            value = abs(value)
+        values = self.values[metric][start:stop]
+        below = np.searchsorted(values, value, side='left')
+        at_or_below = np.searchsorted(values, value, side='right')
+        return (below + at_or_below) / 2 / len(values) * 100
+
+
+# Pitch shape features used to find comparable pitches (as named in the traits table)
+comp_features = ['RelSpeed', 'InducedVertBreak', 'HorizontalBreak', 'SpinRate', 'RelHeight', 'RelSide', 'Extension']
+
+
+# Nearest-neighbor search over every pitcher's pitch types by average shape. Feature
+# vectors are standardized (z-scores over all pitch types in the data) and put in a
+# KD-tree once per data version. Horizontal break and release side are mirrored by the
+# pitcher's release side, so left- and right-handers' pitches compare like for like.
+# Pitch types thrown fewer than `min_pitches` times are not returned as comps. Built
+# from the per-(AutoPitchType, Pitcher) sums of pitch_type_sums.
+class PitchComps:
+    def __init__(self, sums, min_pitches=20):
+        from scipy.spatial import cKDTree
+
+        metrics = rollup_metrics(sums)[comp_features]
+        metrics.insert(0, 'Count', sums['Count'])
+        self.table = (
+            metrics.reset_index()[['Pitcher', 'AutoPitchType', 'Count'] + comp_features]
+            .sort_values(['Pitcher', 'Count'], ascending=[True, False], kind='stable')
+            .reset_index(drop=True)
+        )
+        # Row of each (Pitcher, AutoPitchType), and each pitcher's pitch types, most thrown first
+        keys = list(zip(self.table['Pitcher'], self.table['AutoPitchType']))
+        self.rows = {key: row for row, key in enumerate(keys)}
+        self.arsenals = {}
+        for pitcher, pitch_type in keys:
+            self.arsenals.setdefault(pitcher, []).append(pitch_type)
+
+        # Arm side as the sign of each pitcher's pitch-weighted release side
+        pitchers = sums.groupby(level='Pitcher', observed=True)
+        release_side = pitchers['RelSide_sum'].sum() / pitchers['RelSide_n'].sum()
+        arm_side = np.sign(self.table['Pitcher'].map(release_side).astype(np.float64)).replace(0, 1)
+        features = self.table[comp_features].to_numpy(dtype=np.float64, copy=True)
+        features[:, comp_features.index('HorizontalBreak')] *= arm_side
+        features[:, comp_features.index('RelSide')] *= arm_side
+
+        complete = ~np.isnan(features).any(axis=1)
+        self.mean = features[complete].mean(axis=0)
+        self.scale = features[complete].std(axis=0)
+        self.scale[self.scale == 0] = 1
+        self.features = (features - self.mean) / self.scale
+
+        # Only pitch types with a full feature vector and enough pitches go in the tree
+        self.candidates = np.flatnonzero(complete & (self.table['Count'].to_numpy() >= min_pitches))
+        self.tree = cKDTree(self.features[self.candidates])
+
+    # Pitch types thrown by a pitcher, most thrown first
+    def pitch_types(self, pitcher_name):
+        return self.arsenals.get(pitcher_name, [])
+
+    # The k pitch types of other pitchers closest in shape to a pitcher's pitch type,
+    # nearest first, with their averages and standardized Distance; None if the pitch
+    # type isn't in the data or is missing a feature
+    def nearest(self, pitcher_name, pitch_type, k=10):
+        row = self.rows.get((pitcher_name, pitch_type))
+        if row is None or np.isnan(self.features[row]).any() or len(self.candidates) == 0:
+            return None
+        # Over-fetch by the pitcher's own pitch types, which are dropped from the results
+        own = len(self.pitch_types(pitcher_name))
+        distances, found = self.tree.query(self.features[row], k=min(k + own, len(self.candidates)))
+        distances, found = np.atleast_1d(distances), self.candidates[np.atleast_1d(found)]
+        comps = self.table.iloc[found].assign(Distance=distances)
+        return comps[comps['Pitcher'] != pitcher_name].head(k).reset_index(drop=True)
+
+
+# Metrics followed from game to game in the trend view: output name -> source column
+trend_columns = {
+    'RelSpeed': 'RelSpeed',
+    'SpinRate': 'SpinRate',
+    'InducedVertBreak': 'InducedVertBreak',
+    'HorizontalBreak': 'HorzBreak',
+}
+
+# Statistics kept per (Pitcher, game Date, AutoPitchType): pitch count and, for each
+# trend column, its non-null count, sum, largest and smallest value
+game_keys = ['Pitcher', 'Date', 'AutoPitchType']
+game_sum_columns = ['Count'] + [f'{col}_{stat}' for col in trend_columns.values() for stat in ('n', 'sum')]
+game_max_columns = [f'{col}_max' for col in trend_columns.values()]
+game_min_columns = [f'{col}_min' for col in trend_columns.values()]
+
+
+# Path of the game rollup kept alongside a columnar store (in a games/ directory next to it)
+def game_rollup_path_for(store_path):
+    return os.path.join(os.path.dirname(store_path), 'games', os.path.basename(store_path))
+
+
+# Game rollup rows for a pitch table: one row of statistics per (Pitcher, game Date,
+# AutoPitchType), sorted by those keys. Pitches without one of the keys are left out.
+def game_cells(df):
+    dates = pd.to_datetime(df['Date'], errors='coerce').dt.normalize()
+    keep = (df['Pitcher'].notna() & dates.notna() & df['AutoPitchType'].notna()).to_numpy()
+
+    stats = {
+        'Pitcher': df['Pitcher'].to_numpy()[keep].astype(str),
+        'Date': dates.to_numpy()[keep],
+        'AutoPitchType': df['AutoPitchType'].to_numpy()[keep].astype(str),
+        'Count': np.ones(keep.sum(), dtype=np.int64),
+    }
+    for col in trend_columns.values():
+        values = pd.to_numeric(df[col], errors='coerce').to_numpy(dtype=np.float64)[keep]
+        present = ~np.isnan(values)
+        stats[f'{col}_n'] = present.astype(np.int64)
+        stats[f'{col}_sum'] = np.where(present, values, 0.0)
+        stats[f'{col}_max'] = values
+        stats[f'{col}_min'] = values
+    return merge_game_cells(pd.DataFrame(stats))
+
+
+# Combine game rollup rows with the same keys (e.g. from rollups of several files)
+def merge_game_cells(cells):
+    grouped = cells.groupby(game_keys, sort=True)
+    merged = grouped[game_sum_columns].sum()
+    merged = merged.join(grouped[game_max_columns].max()).join(grouped[game_min_columns].min())
+    return merged.reset_index()
+
+
+# Write the game rollup of a columnar store, tagged with the same source fingerprint
+def write_game_rollup(store_path, cells, fingerprint):
+    path = game_rollup_path_for(store_path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pandas(cells, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[FINGERPRINT_KEY] = json.dumps(fingerprint).encode()
+    table = table.replace_schema_metadata(metadata)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    pq.write_table(table, tmp_path)
+    os.replace(tmp_path, path)
+    return cells
+
+
+# Game rollup of one columnar store, recomputed from the store if it is missing or
+# was computed from a different version of the source file
+def read_game_rollup(store_path):
+    path = game_rollup_path_for(store_path)
+    fingerprint = read_fingerprint(store_path)
+    rollup_fingerprint = read_fingerprint(path)
+    if rollup_fingerprint is not None and rollup_fingerprint['sha256'] == fingerprint['sha256']:
+        return pq.read_table(path).to_pandas()
+    columns = ['Pitcher', 'Date', 'AutoPitchType'] + list(trend_columns.values())
+    return write_game_rollup(store_path, game_cells(read_columns(store_path, columns)), fingerprint)
+
+
+# Game rollup for a CSV or a directory of per-game CSVs. Each source file's rollup is
+# computed when the file is ingested, so new games only add their own rows; files with
+# the same pitcher and date (e.g. both games of a doubleheader) are merged into one game.
+def load_game_rollup(path):
+    update_store(path)
+    if os.path.isdir(path):
+        manifest = read_manifest(path)
+        parts_dir = os.path.join(cache_dir_for(path), 'parts')
+        frames = [read_game_rollup(os.path.join(parts_dir, manifest[name]['part']))
+                  for name in sorted(manifest)]
+        if not frames:
+            return pd.DataFrame(columns=game_keys + game_sum_columns + game_max_columns + game_min_columns)
+        return merge_game_cells(pd.concat(frames, ignore_index=True))
+
+    return read_game_rollup(store_path_for(path))
+
+
+# Per-game statistics of every pitcher, sorted by (Pitcher, Date, AutoPitchType) with
+# the row range of each pitcher, so one pitcher's outings are a slice of the rollup no
+# matter how long their history is
+class GameRollup:
+    def __init__(self, cells):
+        self.cells = cells.reset_index(drop=True)
+        pitchers = self.cells['Pitcher'].to_numpy()
+        starts = np.flatnonzero(np.r_[True, pitchers[1:] != pitchers[:-1]])[:len(pitchers)]
+        stops = np.r_[starts[1:], len(pitchers)]
+        self.offsets = {pitchers[start]: (start, stop) for start, stop in zip(starts, stops)}
+        self.dates = self.cells['Date'].to_numpy()
+
+    # Per-game mean and max of each trend metric by pitch type for a pitcher's games in
+    # [start_date, end_date) (all games if not given). "Max" of a magnitude metric is the
+    # value furthest from zero, keeping its sign.
+    def games(self, pitcher_name, start_date=None, end_date=None):
+        start, stop = self.offsets.get(pitcher_name, (0, 0))
+        dates = self.dates[start:stop]
+        lo = np.searchsorted(dates, start_date, side='left') if start_date is not None else 0
+        hi = np.searchsorted(dates, end_date, side='left') if end_date is not None else len(dates)
+        rows = self.cells.iloc[start + lo:start + max(lo, hi)]
+
+        table = rows[['Date', 'AutoPitchType', 'Count']].reset_index(drop=True)
+        for name, col in trend_columns.items():
+            n = rows[f'{col}_n'].to_numpy()
+            table[name] = np.where(n > 0, rows[f'{col}_sum'].to_numpy() / np.maximum(n, 1), np.nan)
+            largest, smallest = rows[f'{col}_max'].to_numpy(), rows[f'{col}_min'].to_numpy()
+            if name in magnitude_metrics:
+                largest = np.where(np.abs(smallest) > np.abs(largest), smallest, largest)
+            table[f'{name} Max'] = largest
+        return table
+
+
+# Columns of a partitioned store: the report columns plus the discipline flags
+partition_columns = report_columns + flag_columns
+
+
+# Fixed Arrow schema of the chunked ingest's spill and partition files, so every batch
+# has the same types whatever values it happens to hold
+def partition_schema():
+    fields = []
+    for col in partition_columns:
+        if col in category_columns:
+            fields.append(pa.field(col, pa.string()))
+        elif col == 'Date':
+            fields.append(pa.field(col, pa.timestamp('ns')))
+        elif col in flag_columns:
+            fields.append(pa.field(col, pa.bool_()))
+        elif col in numeric_columns or col in count_columns:
+            fields.append(pa.field(col, pa.float32()))
+        else:
+            fields.append(pa.field(col, pa.float64()))
+    return pa.schema(fields)
+
+
+# Total size in bytes of the source CSV(s)
+def source_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, name)) for name in source_files(path))
+    return os.path.getsize(path)
+
+
+# Whether a source is large enough to go through the chunked ingest (see chunked_source_bytes)
+def use_chunked_ingest(path):
+    return source_bytes(path) >= int(os.environ.get(CHUNKED_ENV, chunked_source_bytes))
+
+
+# Directory holding the partitioned stores of one source (one per version)
+def partitioned_root(path):
+    return os.path.join(cache_dir_for(path), PARTITIONED_DIR_NAME, source_name(path))
+
+
+# Directory of the partitioned store for one version of a source
+def partitioned_dir(path, version):
+    return os.path.join(partitioned_root(path), f'{version}-{partition_layout}')
+
+
+# Delete a partitioned store unless a process is reading it (holds its lock shared);
+# True if it was deleted
+def remove_partitioned_store(directory):
+    if fcntl is None:
+        return False
+    try:
+        lock = open(os.path.join(directory, PARTITION_LOCK_NAME), 'a')
+    except OSError:
+        return False
+    with lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            return False
+        shutil.rmtree(directory, ignore_errors=True)
+    return True
+
+
+# Take a partitioned store's lock shared, so that it is not pruned while it is read.
+# Returns the open lock file (the lock is held until it is closed), or None if the
+# store is gone or incomplete.
+def lock_partitioned_store(directory):
+    try:
+        lock = open(os.path.join(directory, PARTITION_LOCK_NAME), 'a')
+    except FileNotFoundError:
+        return None
+    if fcntl is not None:
+        fcntl.flock(lock, fcntl.LOCK_SH)
+    if not os.path.exists(os.path.join(directory, PARTITION_INDEX_NAME)):
+        lock.close()
+        return None
+    return lock
+
+
+# Batches of at most `rows` pitches from one CSV, with only the report columns parsed,
+# typed like the columnar store, with discipline flags added
+def csv_chunks(file_path, rows=chunk_rows):
+    reader = pd.read_csv(file_path, usecols=lambda col: col in report_columns, chunksize=rows, low_memory=False)
+    for chunk in reader:
+        for col in report_columns:
+            if col not in chunk.columns:
+                chunk[col] = np.nan
+        chunk['Date'] = pd.to_datetime(chunk['Date'], errors='coerce')
+        for col in numeric_columns + count_columns:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce').astype(np.float32)
+        for col in ['PlateLocSide', 'PlateLocHeight']:
+            chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+        for col in category_columns:
+            chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str))
+        yield add_discipline_flags(chunk)[partition_columns]
+
+
+# Source files of a CSV or a directory of CSVs as (name, path), in name order
+def source_paths(path):
+    if os.path.isdir(path):
+        return [(name, os.path.join(path, name)) for name in source_files(path)]
+    return [(os.path.basename(path), path)]
+
+
+# The most recent complete partitioned store of a source (in the current layout) other
+# than `directory`, as (index, directory, lock) with its lock held shared (see
+# lock_partitioned_store), or None
+def previous_partitioned_store(path, directory):
+    root = partitioned_root(path)
+    if not os.path.isdir(root):
+        return None
+    stores = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(root)
+                    if entry.is_dir() and entry.name.endswith(f'-{partition_layout}') and entry.path != directory)
+    for _, store_dir in reversed(stores):
+        lock = lock_partitioned_store(store_dir)
+        if lock is None:
+            continue
+        with open(os.path.join(store_dir, PARTITION_INDEX_NAME)) as f:
+            return json.load(f), store_dir, lock
+    return None
+
+
+# Spill a batch of pitches into `buckets` bucket files (opened in `writers` as needed)
+# by a hash of the pitcher's name, so each bucket ends up with every pitch of its pitchers
+def spill_chunk(chunk, writers, spill_dir, buckets, schema):
+    bucket = pd.util.hash_array(chunk['Pitcher'].to_numpy(dtype=object)) % buckets
+    order = np.argsort(bucket, kind='stable')
+    bounds = np.searchsorted(bucket[order], np.arange(buckets + 1))
+    table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+    for b in range(buckets):
+        if bounds[b] == bounds[b + 1]:
+            continue
+        if b not in writers:
+            writers[b] = pq.ParquetWriter(os.path.join(spill_dir, f'{b}.parquet'), schema)
+        writers[b].write_table(table.take(order[bounds[b]:bounds[b + 1]]))
+
+
+# Write the files of every pitcher in the spilled buckets, one bucket at a time (see
+# ingest_chunked). Returns ({pitcher: file name}, [season sums per bucket]).
+def write_partitions(build_dir, spill_dir, bucket_ids, schema):
+    files = {}
+    sums = []
+    for b in sorted(bucket_ids):
+        bucket_path = os.path.join(spill_dir, f'{b}.parquet')
+        df = pq.read_table(bucket_path).to_pandas()
+        df = df.sort_values(['Pitcher', 'Date'], kind='stable').reset_index(drop=True)
+        cells = cube_cells(df)
+        games = game_cells(df).sort_values(game_keys, kind='stable').reset_index(drop=True)
+        sums.append(pitch_type_sums(cells).reset_index())
+
+        # Every table is sorted by Pitcher, so each pitcher's rows are one slice of it
+        tables = {'pitchers': df, 'cube': cells, 'games': games}
+        slices = {name: pitcher_slices(table) for name, table in tables.items()}
+        for name in slices['pitchers']:
+            files[name] = partition_file_name(name)
+            for kind, table in tables.items():
+                start, stop = slices[kind].get(name, (0, 0))
+                rows = pa.Table.from_pandas(table.iloc[start:stop], schema=schema if kind == 'pitchers' else None,
+                                            preserve_index=False)
+                pq.write_table(rows, os.path.join(build_dir, kind, files[name]))
+        del df, cells, games
+        os.remove(bucket_path)
+    return files, sums
+
+
+# File name of a pitcher's partition, cube and games files (the same in every store)
+def partition_file_name(pitcher_name):
+    return hashlib.sha256(pitcher_name.encode()).hexdigest()[:16] + '.parquet'
+
+
+# Build the pitcher-partitioned store for a source in bounded memory:
+#   1. Stream the source in batches of `rows` pitches (report columns only, discipline
+#      flags added), spilling each batch's pitches to one of a few bucket files by a hash
+#      of the pitcher's name.
+#   2. Read one bucket at a time. A bucket holds every pitch of its pitchers, so its
+#      aggregates are final: each pitcher's pitches (sorted by Date), aggregate cube
+#      cells and game rollup go to their own files, and the season sums per
+#      (AutoPitchType, Pitcher) (see pitch_type_sums) to one file for the D1-wide ranks.
+# The index records each source file's size, mtime, rows and pitchers. A directory of
+# per-game CSVs whose previous store is still on disk is updated rather than rebuilt:
+# only the files added, changed or removed since then are streamed, plus the other files
+# of the pitchers in them (for just those pitchers' rows); every other pitcher's files
+# are hard-linked from the previous store. A new game costs its pitchers' games, not the
+# whole source. A single CSV is always rebuilt in full.
+# Peak memory is one batch or one bucket (with its aggregates), whatever the source size.
+# Returns the store's directory.
+def ingest_chunked(path, rows=chunk_rows):
+    version = source_version(path)
+    directory = partitioned_dir(path, version)
+    build_dir = f"{directory}.{os.getpid()}-{threading.get_ident()}.tmp"
+    spill_dir = os.path.join(build_dir, 'spill')
+    os.makedirs(spill_dir, exist_ok=True)
+    for name in ('pitchers', 'cube', 'games'):
+        os.makedirs(os.path.join(build_dir, name), exist_ok=True)
+
+    schema = partition_schema()
+    buckets = max(1, -(-source_bytes(path) // bucket_source_bytes))
+    paths = dict(source_paths(path))
+    sources = {name: source_stat(file_path) for name, file_path in paths.items()}
+    previous = previous_partitioned_store(path, directory) if os.path.isdir(path) else None
+    old_sources = previous[0].get('sources', {}) if previous else {}
+    same = {name for name in sources if name in old_sources
+            and all(old_sources[name][key] == value for key, value in sources[name].items())}
+
+    writers = {}
+    try:
+        # Every pitch of the new and changed files; their pitchers, and those of removed
+        # or changed files, are the ones whose files are rewritten
+        changed = {pitcher for name in set(old_sources) - same for pitcher in old_sources[name]['pitchers']}
+        for name in sorted(set(sources) - same):
+            pitchers, total = {}, 0
+            for chunk in csv_chunks(paths[name], rows):
+                chunk = chunk[chunk['Pitcher'].notna()]
+                total += len(chunk)
+                pitchers.update(dict.fromkeys(chunk['Pitcher'].unique()))
+                spill_chunk(chunk, writers, spill_dir, buckets, schema)
+            sources[name].update(rows=total, pitchers=list(pitchers))
+            changed.update(pitchers)
+
+        # The rest of those pitchers' pitches, from the unchanged files they appear in
+        for name in sorted(same):
+            sources[name] = old_sources[name]
+            if changed.isdisjoint(sources[name]['pitchers']):
+                continue
+            for chunk in csv_chunks(paths[name], rows):
+                chunk = chunk[chunk['Pitcher'].isin(changed)]
+                if len(chunk):
+                    spill_chunk(chunk, writers, spill_dir, buckets, schema)
+    finally:
+        for writer in writers.values():
+            writer.close()
+
+    files, sums = write_partitions(build_dir, spill_dir, writers, schema)
+    os.rmdir(spill_dir)
+
+    if previous:
+        index, previous_dir, lock = previous
+        with lock:
+            for name, file in index['files'].items():
+                if name in changed:
+                    continue
+                files[name] = file
+                for kind in ('pitchers', 'cube', 'games'):
+                    try:
+                        os.link(os.path.join(previous_dir, kind, file), os.path.join(build_dir, kind, file))
+                    except OSError:
+                        shutil.copy2(os.path.join(previous_dir, kind, file), os.path.join(build_dir, kind, file))
+            kept = pd.read_parquet(os.path.join(previous_dir, PARTITION_SUMS_NAME))
+            sums.append(kept[~kept['Pitcher'].isin(changed)])
+    empty = pitch_type_sums(cube_cells(partition_schema().empty_table().to_pandas())).reset_index()
+    pq.write_table(pa.Table.from_pandas(pd.concat([empty] + sums, ignore_index=True), preserve_index=False),
+                   os.path.join(build_dir, PARTITION_SUMS_NAME))
+
+    # Pitchers in the order they first appear, going through the files in name order
+    pitchers = dict.fromkeys(pitcher for name in sorted(sources) for pitcher in sources[name]['pitchers'])
+    open(os.path.join(build_dir, PARTITION_LOCK_NAME), 'w').close()
+    with open(os.path.join(build_dir, PARTITION_INDEX_NAME), 'w') as f:
+        json.dump({'version': version, 'rows': sum(entry['rows'] for entry in sources.values()),
+                   'pitchers': list(pitchers), 'files': files, 'sources': sources}, f)
+
+    # Publish the finished store by renaming it into place; if another process got there
+    # first, keep theirs
+    try:
+        os.rename(build_dir, directory)
+    except OSError:
+        shutil.rmtree(build_dir, ignore_errors=True)
+
+    # Older stores of this source only, skipping any that a process is still reading
+    versions = sorted((entry.stat().st_mtime, entry.path) for entry in os.scandir(partitioned_root(path))
+                      if entry.is_dir() and not entry.name.endswith('.tmp'))
+    for _, old_dir in versions[:-shared_versions_kept]:
+        if old_dir != directory:
+            remove_partitioned_store(old_dir)
+    return directory
+
+
+# Row range of each pitcher in a table sorted by Pitcher
+def pitcher_slices(df):
+    names = df['Pitcher'].to_numpy()
+    starts = np.flatnonzero(np.r_[True, names[1:] != names[:-1]])[:len(names)]
+    stops = np.r_[starts[1:], len(names)]
+    return {names[start]: (start, stop) for start, stop in zip(starts, stops)}
+
+
+# Pitcher-partitioned store of a large source, built by ingest_chunked if it doesn't
+# exist yet for the current version, and never pruned while this object lives (its
+# lock is held; see lock_partitioned_store). If the store is pruned before the lock is
+# taken, it is built again. Only the season sums per (AutoPitchType, Pitcher) are held
+# for all of the data; a pitcher's pitches, aggregate cube and game rollup are read
+# from that pitcher's files when selected (the most recently used partitions_cached of
+# each stay in memory).
+class PartitionedStore:
+    def __init__(self, path, rows=chunk_rows):
+        self.version = source_version(path)
+        self.directory = partitioned_dir(path, self.version)
+        self.lock = None
+        while self.lock is None:
+            if not os.path.exists(os.path.join(self.directory, PARTITION_INDEX_NAME)):
+                ingest_chunked(path, rows)
+            self.lock = lock_partitioned_store(self.directory)
+        with open(os.path.join(self.directory, PARTITION_INDEX_NAME)) as f:
+            index = json.load(f)
+        self.rows = index['rows']
+        self.pitchers = index['pitchers']
+        self.files = index['files']
+
+        self.empty = partition_schema().empty_table().to_pandas()
+        self.pitch_type_sums = (
+            pq.read_table(os.path.join(self.directory, PARTITION_SUMS_NAME)).to_pandas()
+            .set_index(['AutoPitchType', 'Pitcher'])
+        )
+        self.partitions = LRUCache(maxsize=partitions_cached)
+        self.cubes = LRUCache(maxsize=partitions_cached)
+        self.game_rollups = LRUCache(maxsize=partitions_cached)
+
+    # One of a pitcher's files ('pitchers', 'cube' or 'games') as a DataFrame, or None
+    # for a pitcher not in the store
+    def read_pitcher_file(self, kind, pitcher_name):
+        file = self.files.get(pitcher_name)
+        if file is None:
+            return None
+        return pq.read_table(os.path.join(self.directory, kind, file)).to_pandas()
+
+    # One pitcher's pitches, sorted by Date, with the compact dtypes of load_pitches
+    def read_partition(self, pitcher_name):
+        df = self.read_pitcher_file('pitchers', pitcher_name)
+        return compact_pitches(self.empty.copy() if df is None else df)
+
+    # PitcherIndex over a single pitcher's partition
+    def pitcher_index(self, pitcher_name):
+        return self.partitions.get(
+            pitcher_name,
+            lambda: PitcherIndex(self.read_partition(pitcher_name), self.version, is_sorted=True)
+        )
+
+    # AggregateCube over a single pitcher's cube cells
+    def cube(self, pitcher_name):
+        def load():
+            cells = self.read_pitcher_file('cube', pitcher_name)
+            return AggregateCube(version=self.version, cells=cube_cells(self.empty) if cells is None else cells)
+        return self.cubes.get(pitcher_name, load)
+
+    # GameRollup over a single pitcher's games
+    def games(self, pitcher_name):
+        def load():
+            cells = self.read_pitcher_file('games', pitcher_name)
+            return GameRollup(game_cells(self.empty) if cells is None else cells)
+        return self.game_rollups.get(pitcher_name, load)
+
+
+if __name__ == '__main__':
+    # Pre-build the columnar store, e.g. as a deploy step: python pitch_data.py data.csv
+    # (or a directory of per-game CSVs)
+    parser = argparse.ArgumentParser(description="Build the columnar store for TrackMan CSVs.")
+    parser.add_argument('paths', nargs='*', default=['OM_OpposingPitchers_2024.csv'])
+    parser.add_argument('--memory-report', action='store_true',
+                        help="Compare the memory of the full table at default dtypes with the compact one")
+    parser.add_argument('--chunked', action='store_true',
+                        help="Build the pitcher-partitioned store in bounded memory (for sources larger than RAM)")
+    parser.add_argument('--chunk-rows', type=int, default=chunk_rows, help="Rows per batch of the chunked ingest")
+    args = parser.parse_args()
+    for path in args.paths:
+        if args.chunked:
+            print(f"{path} -> {ingest_chunked(path, args.chunk_rows)}")
+            continue
+        if not args.memory_report:
+            print(f"{path} -> {update_store(path)}")
+            continue
+        print(path)
+        files = [os.path.join(path, name) for name in source_files(path)] if os.path.isdir(path) else [path]
+        full = pd.concat([pd.read_csv(file_path, low_memory=False) for file_path in files], ignore_index=True)
+        print(memory_report(before=full, after=load_pitches(path)).to_string())
@@ -0,0 +1,381 @@
+import hashlib
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from pitch_data import LRUCache, zone_bottom, zone_half_width, zone_top
+
+# matplotlib is imported inside the render functions: it takes longer to import than
+# everything else on the page, and is only needed once a figure isn't in the cache
+
+# Plate window shown in the heat maps (feet)
+plate_x_limits = (-2, 2)
+plate_y_limits = (1, 4)
+
+# Density grid resolution and padding (in bandwidths) around the plate window,
+# matching seaborn's kdeplot defaults (gridsize=200, cut=3)
+density_gridsize = 200
+density_cut = 3
+
+# Iso-proportion contour levels drawn by the heat maps (seaborn's levels=6, thresh=.05)
+density_levels = np.linspace(0.05, 1, 6)
+
+
+# Linear binning: each point's unit weight is split between the four surrounding grid nodes
+def bin_points(x, y, xs, ys):
+    nx, ny = len(xs), len(ys)
+    fx = (x - xs[0]) / (xs[1] - xs[0])
+    fy = (y - ys[0]) / (ys[1] - ys[0])
+    keep = (fx >= 0) & (fx < nx - 1) & (fy >= 0) & (fy < ny - 1)
+    fx, fy = fx[keep], fy[keep]
+    ix, iy = fx.astype(int), fy.astype(int)
+    wx, wy = fx - ix, fy - iy
+
+    counts = np.zeros(nx * ny)
+    for ox, oy, weight in [(0, 0, (1 - wx) * (1 - wy)), (1, 0, wx * (1 - wy)),
+                           (0, 1, (1 - wx) * wy), (1, 1, wx * wy)]:
+        counts += np.bincount((iy + oy) * nx + ix + ox, weights=weight, minlength=nx * ny)
+    return counts.reshape(ny, nx)
+
+
+# 2D convolution via FFT, cropped to the shape of `grid` (kernel dimensions must be odd)
+def fft_convolve(grid, kernel):
+    shape = (grid.shape[0] + kernel.shape[0] - 1, grid.shape[1] + kernel.shape[1] - 1)
+    full = np.fft.irfft2(np.fft.rfft2(grid, shape) * np.fft.rfft2(kernel, shape), shape)
+    ky, kx = kernel.shape[0] // 2, kernel.shape[1] // 2
+    return full[ky:ky + grid.shape[0], kx:kx + grid.shape[1]]
+
+
+# Density values enclosing the given proportions of probability mass (as seaborn computes them)
+def quantile_to_level(density, proportions):
+    values = np.sort(density.ravel())[::-1]
+    cumulative = np.cumsum(values) / values.sum()
+    return np.take(values, np.searchsorted(cumulative, 1 - np.asarray(proportions)), mode='clip')
+
+
+# Gaussian KDE of pitch locations over the plate window, computed by binning the
+# pitches onto a grid and convolving with the kernel via FFT. The kernel matches
+# seaborn's (Scott's rule on the full covariance, scaled by bw_adjust), so the
+# contours match sns.kdeplot at a fraction of the cost.
+# Returns (xs, ys, density, levels), or None when the covariance is singular.
+def plate_density(x, y, bw_adjust=1):
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if n < 2:
+        return None
+
+    cov = np.cov(x, y) * (n ** (-1 / 6) * bw_adjust) ** 2
+    det = np.linalg.det(cov) if np.all(np.isfinite(cov)) else 0
+    if det <= 0:
+        return None
+    bw = np.sqrt(np.diag(cov))
+
+    xs = np.linspace(plate_x_limits[0] - density_cut * bw[0], plate_x_limits[1] + density_cut * bw[0], density_gridsize)
+    ys = np.linspace(plate_y_limits[0] - density_cut * bw[1], plate_y_limits[1] + density_cut * bw[1], density_gridsize)
+    counts = bin_points(x, y, xs, ys)
+
+    # Kernel sampled on grid offsets out to 4 bandwidths (or the grid size, if smaller)
+    dx, dy = xs[1] - xs[0], ys[1] - ys[0]
+    kx = min(int(np.ceil(4 * bw[0] / dx)), density_gridsize - 1)
+    ky = min(int(np.ceil(4 * bw[1] / dy)), density_gridsize - 1)
+    ox, oy = np.meshgrid(np.arange(-kx, kx + 1) * dx, np.arange(-ky, ky + 1) * dy)
+    inv = np.linalg.inv(cov)
+    kernel = np.exp(-0.5 * (inv[0, 0] * ox ** 2 + 2 * inv[0, 1] * ox * oy + inv[1, 1] * oy ** 2))
+    kernel /= 2 * np.pi * np.sqrt(det)
+
+    density = np.clip(fft_convolve(counts, kernel), 0, None) / n
+    return xs, ys, density, quantile_to_level(density, density_levels)
+
+
+# Bump when the layout of a cached figure changes, so old renders are not reused
+figure_cache_version = 2
+
+# Matches st.pyplot's defaults so cached images look the same as the figures they replace
+figure_dpi = 200
+
+
+# Heat map panels are shown a few to a row, so they don't need the full figure dpi
+panel_dpi = 100
+
+# Widest image st.image displays as is; wider ones are decoded, scaled down and
+# re-encoded by Streamlit every time they are shown
+max_image_width = 1460
+
+# Define a color dictionary for each pitch type
+color_dict = {
+    'Fastball': 'blue',
+    'FourSeamFastball': 'blue',
+    'Four-Seam': 'blue',
+    'TwoSeamFastball': 'gold',
+    'Sinker': 'gold',
+    'Slider': 'green',
+    'Curveball': 'red',
+    'Cutter': 'orange',
+    'ChangeUp': 'purple',
+    'Changeup': 'purple',
+    'Splitter': 'teal',
+    'Unknown': 'black',
+    'Other': 'black'
+}
+
+
+# Encode a matplotlib figure as PNG bytes
+def figure_png(fig, dpi=figure_dpi):
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    FigureCanvasAgg(fig)
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png', dpi=dpi, bbox_inches='tight')
+    image = buffer.getvalue()
+
+    # Width from the PNG header; render once more at a dpi that fits if it's too wide
+    width = int.from_bytes(image[16:20], 'big')
+    if width > max_image_width:
+        buffer = io.BytesIO()
+        fig.savefig(buffer, format='png', dpi=dpi * max_image_width // width, bbox_inches='tight')
+        image = buffer.getvalue()
+    return image
+
+
+# Render one pitch type's heat map panel to PNG bytes. Uses its own Agg Figure (no pyplot
+# state), so panels can be drawn concurrently in threads or worker processes.
+# `density` is the plate_density result, or None to draw the pitch locations only.
+def render_heatmap_panel(title, x, y, density, dpi=panel_dpi):
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Rectangle
+
+    fig = Figure(figsize=(12, 10))
+    ax = fig.add_subplot()
+
+    if len(x) < 5:  # Switch to scatter plot for small data
+        ax.scatter(x, y, color='blue', edgecolor='white')
+    elif density is not None:
+        xs, ys, density_grid, levels = density
+        ax.contourf(xs, ys, density_grid, levels=levels, cmap='Spectral_r')
+
+    # Plot individual pitch locations as dots
+    ax.scatter(
+        x,
+        y,
+        color='black',  # Color for the dots
+        edgecolor='white',  # Add a white border to make dots stand out
+        s=300,  # Size of the dots
+        alpha=0.7  # Transparency to allow overlap
+    )
+
+    # Add strike zone as a rectangle with black edgecolor
+    # (width 1.66166 ft: widest raw strike, formerly 17/12)
+    strike_zone = Rectangle(
+        (-zone_half_width, zone_bottom),
+        2 * zone_half_width,
+        zone_top - zone_bottom,
+        edgecolor='black',  # Black edge color for the strike zone
+        facecolor='none',
+        linewidth=2
+    )
+    ax.add_patch(strike_zone)
+
+    # Set axis limits and remove ticks and labels
+    ax.set_xlim(*plate_x_limits)
+    ax.set_ylim(*plate_y_limits)
+    ax.set_xticks([])
+    ax.set_yticks([])
+
+    # Set pitch type as title, with an equal aspect ratio
+    ax.set_title(title, fontsize=20)
+    ax.set_aspect('equal', adjustable='box')
+    fig.tight_layout()
+    return figure_png(fig, dpi)
+
+
+# Render the pitch movement chart (HorzBreak vs InducedVertBreak by pitch type) to PNG bytes
+def render_movement_chart(movement_data, dpi=figure_dpi):
+    from matplotlib.figure import Figure
+    from matplotlib.patches import Circle
+    from matplotlib.ticker import MultipleLocator
+
+    fig = Figure(figsize=(8, 8))
+    ax = fig.add_subplot()
+
+    # Set axis limits and labels
+    ax.set_xlim(-25, 25)
+    ax.set_ylim(-25, 25)
+    ax.set_xlabel("Horizontal Break (inches)", fontsize=12)
+    ax.set_ylabel("Induced Vertical Break (inches)", fontsize=12)
+
+    # Add grid lines every 5 units
+    ax.xaxis.set_major_locator(MultipleLocator(5))
+    ax.yaxis.set_major_locator(MultipleLocator(5))
+    ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+    # Add bold black lines through the origin
+    ax.axhline(0, color='black', linewidth=2, zorder=1)
+    ax.axvline(0, color='black', linewidth=2, zorder=1)
+
+    # Plot each pitch, colored by pitch type, with a higher z-order
+    for pitch_type in movement_data['AutoPitchType'].unique():
+        pitch_type_data = movement_data[movement_data['AutoPitchType'] == pitch_type]
+
+        # Set color based on pitch type, default to black for unknown types
+        color = color_dict.get(pitch_type, 'black')
+
+        # Plot individual pitches
+        ax.scatter(
+            pitch_type_data['HorzBreak'],
+            pitch_type_data['InducedVertBreak'],
+            label=pitch_type,
+            color=color,
+            s=50,
+            alpha=0.7,
+            zorder=2  # Higher z-order to plot above the lines
+        )
+
+        # Draw a circle around the cluster mean, with radius from the standard deviations
+        mean_horz = pitch_type_data['HorzBreak'].mean()
+        mean_vert = pitch_type_data['InducedVertBreak'].mean()
+        std_dev = np.sqrt(pitch_type_data['HorzBreak'].std()**2 + pitch_type_data['InducedVertBreak'].std()**2)
+        ax.add_patch(Circle((mean_horz, mean_vert), std_dev, color=color, alpha=0.3, zorder=1))
+
+    # Add a legend for pitch types
+    ax.legend(title="Pitch Type", bbox_to_anchor=(1.05, 1), loc='upper left')
+    return figure_png(fig, dpi)
+
+
+# Axis labels of the trend chart metrics (pitch_data.trend_columns)
+trend_labels = {
+    'RelSpeed': "Velocity (mph)",
+    'SpinRate': "Spin Rate (rpm)",
+    'InducedVertBreak': "Induced Vertical Break (inches)",
+    'HorizontalBreak': "Horizontal Break (inches)",
+}
+
+
+# Render a pitcher's game-by-game trend of one metric to PNG bytes: the per-game mean of
+# each pitch type as a solid line, and its per-game max as a dotted line of the same color.
+# `games` is a pitch_data.GameRollup.games table.
+def render_trend_chart(games, metric, dpi=figure_dpi):
+    from matplotlib.dates import AutoDateLocator, ConciseDateFormatter
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 5))
+    ax = fig.add_subplot()
+
+    # Most thrown pitch types first, so they lead the legend
+    counts = games.groupby('AutoPitchType')['Count'].sum().sort_values(ascending=False)
+    for pitch_type in counts.index:
+        pitch_type_data = games[games['AutoPitchType'] == pitch_type]
+        color = color_dict.get(pitch_type, 'black')
+        ax.plot(pitch_type_data['Date'], pitch_type_data[metric], marker='o', color=color, label=pitch_type)
+        ax.plot(pitch_type_data['Date'], pitch_type_data[f'{metric} Max'], linestyle=':', color=color, alpha=0.6)
+
+    locator = AutoDateLocator()
+    ax.xaxis.set_major_locator(locator)
+    ax.xaxis.set_major_formatter(ConciseDateFormatter(locator))
+    ax.set_xlabel("Game Date", fontsize=12)
+    ax.set_ylabel(trend_labels.get(metric, metric), fontsize=12)
+    ax.grid(True, linestyle='--', linewidth=0.5)
+    ax.legend(title="Pitch Type (dotted: game max)", bbox_to_anchor=(1.02, 1), loc='upper left')
+    return figure_png(fig, dpi)
+
+
+# Worker processes for rendering heat map panels. Spawned rather than forked, since
+# forking a multi-threaded server process (like Streamlit's) is unsafe.
+def make_render_pool(max_workers=None):
+    return ProcessPoolExecutor(max_workers=max_workers or os.cpu_count(),
+                               mp_context=multiprocessing.get_context('spawn'))
+
+
+# Render heat map panels, yielding (position, png) as each one finishes.
+# `panels` is a list of render_heatmap_panel argument tuples; without a pool they render in order.
+def render_panels(panels, pool=None):
+    if pool is None:
+        for i, panel in enumerate(panels):
+            yield i, render_heatmap_panel(*panel)
+        return
+
+    futures = {pool.submit(render_heatmap_panel, *panel): i for i, panel in enumerate(panels)}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+# Rendered figure images, kept in an in-memory LRU and a size-capped directory on
+# disk that survives restarts. Keys must have a stable repr (strings, numbers, tuples).
+class FigureCache:
+    def __init__(self, directory, memory_items=32, disk_bytes=256 * 1024 * 1024):
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.memory = LRUCache(maxsize=memory_items)
+        # Lookups answered from disk, and lookups that found nothing (figures to render)
+        self.disk_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key):
+        digest = hashlib.sha256(repr((figure_cache_version,) + tuple(key)).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.png')
+
+    # Cached image bytes, or None if the figure needs rendering
+    def get(self, key):
+        found, image = self.memory.lookup(key)
+        if found:
+            return image
+
+        path = self.path_for(key)
+        try:
+            with open(path, 'rb') as f:
+                image = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+        # Mark as recently used for disk eviction, and promote to the memory tier
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.memory.put(key, image)
+        return image
+
+    # Hits (from memory or disk) and misses, in the same form as LRUCache.stats for the memory tier
+    def stats(self):
+        memory = self.memory.stats()
+        with self._lock:
+            return dict(memory, hits=memory['hits'] + self.disk_hits, disk_hits=self.disk_hits, misses=self.misses)
+
+    def put(self, key, image):
+        self.memory.put(key, image)
+
+        path = self.path_for(key)
+        tmp_path = f"{path}.{os.getpid()}-{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(image)
+        os.replace(tmp_path, path)
+        self.trim()
+
+    # Delete least recently used images until the directory is under the size cap
+    def trim(self):
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.png'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
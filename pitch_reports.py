@@ -0,0 +1,212 @@
+import threading
+
+import pandas as pd
+
+import pitch_data
+import pitch_plots
+
+# Column order of the Plate Discipline table
+plate_discipline_columns = ['AutoPitchType', 'Count', 'Pitch%', 'Strike%', 'InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%']
+
+
+# Function to manually format the dataframe before displaying
+def format_dataframe(df):
+    df = df.copy()  # Create a copy to avoid warnings
+    percent_columns = ['InZone%', 'Swing%', 'Whiff%', 'Chase%', 'InZoneWhiff%']
+
+    for col in df.columns:
+        if col in percent_columns:
+            df[col] = df[col].apply(lambda x: f"{round(x, 2)}%" if pd.notna(x) and isinstance(x, (int, float)) else 'N/A')  # Add % symbol to percentage columns
+        elif df[col].dtype.kind in 'f':  # if it's a float type column
+            df[col] = df[col].apply(lambda x: round(x, 2) if pd.notna(x) else 'N/A')
+        else:
+            df[col] = df[col].fillna('N/A')  # Fill NaN with N/A for non-float columns
+    return df
+
+
+# Pitch Traits table for a selection from the aggregate cube, most thrown pitch type
+# first (unformatted), or None if no pitches match
+def pitch_traits_table(cube, *filters):
+    rolled = cube.rollup(*filters)
+    if rolled.empty:
+        return None
+    return pitch_data.traits_table_from_rollup(rolled).sort_values(by='Count', ascending=False)
+
+
+# Plate Discipline table for a selection from the aggregate cube, most thrown pitch type
+# first (unformatted), or None if no pitches match
+def plate_discipline_table(cube, *filters):
+    rolled = cube.rollup(*filters)
+    if rolled.empty:
+        return None
+    table = pitch_data.discipline_table_from_rollup(rolled).sort_values(by='Count', ascending=False)
+    return table[plate_discipline_columns]
+
+
+# Copy of a traits or discipline table with a "<metric> Pctl" column after each metric,
+# ranking the value against all pitchers throwing the same pitch type (a
+# pitch_data.PercentileRanks). Ranks are whole numbers, or N/A.
+def with_percentiles(table, ranks):
+    table = table.copy()
+    for metric in pitch_data.percentile_metrics:
+        if metric not in table.columns:
+            continue
+        values = pd.to_numeric(table[metric], errors='coerce')
+        percentiles = [ranks.percentile(pitch_type, metric, value)
+                       for pitch_type, value in zip(table['AutoPitchType'], values)]
+        column = pd.Series([round(p) if pd.notna(p) else None for p in percentiles], index=table.index, dtype=object)
+        table.insert(table.columns.get_loc(metric) + 1, f"{metric} Pctl", column)
+    return table
+
+
+# A pitcher's per-game trend metrics by pitch type from the game rollup (a
+# pitch_data.GameRollup) for the sidebar date filter, or None if there are no games.
+# Batter side and count filters don't apply: the rollup is kept per game.
+def trend_table(games, pitcher_name, date_filter_option, selected_date, start_date, end_date):
+    table = games.games(pitcher_name, *pitch_data.date_bounds(date_filter_option, selected_date, start_date, end_date))
+    return table if not table.empty else None
+
+
+# Title over the heat map panels
+def heatmap_title(pitcher_name, batter_side, strikes, balls):
+    return f"{pitcher_name} Heat Maps (Batter: {batter_side}, Strikes: {strikes}, Balls: {balls})"
+
+
+# Pitches with a plate location, for the heat maps
+def heatmap_data(pitcher_data):
+    return pitcher_data.dropna(subset=['PlateLocSide', 'PlateLocHeight'])
+
+
+# Pitches with movement measurements, for the movement chart
+def movement_data(pitcher_data):
+    return pitcher_data.dropna(subset=['InducedVertBreak', 'HorzBreak'])
+
+
+# Heat map panels as (pitch_type, render_heatmap_panel arguments), for `pitch_types` or
+# else every pitch type in `plot_data` in order of appearance. Densities go through
+# `density_cache` (an LRUCache) when given, keyed by `selection_key` and pitch type.
+def heatmap_panels(plot_data, pitcher_name, selection_key=None, density_cache=None, pitch_types=None):
+    if pitch_types is None:
+        pitch_types = plot_data['AutoPitchType'].unique()
+    panels = []
+    for pitch_type in pitch_types:
+        pitch_type_data = plot_data[plot_data['AutoPitchType'] == pitch_type]
+        x = pitch_type_data['PlateLocSide'].to_numpy()
+        y = pitch_type_data['PlateLocHeight'].to_numpy()
+
+        density = None
+        if len(pitch_type_data) >= 5:
+            bw_adjust_value = 0.5 if len(pitch_type_data) > 50 else 1  # Adjust bandwidth for small datasets
+            if density_cache is None:
+                density = pitch_plots.plate_density(x, y, bw_adjust_value)
+            else:
+                density = density_cache.get(
+                    selection_key + (pitch_type, bw_adjust_value),
+                    lambda: pitch_plots.plate_density(x, y, bw_adjust_value)
+                )
+        panels.append((pitch_type, (f"{pitch_type} ({pitcher_name})", x, y, density)))
+    return panels
+
+
+# Everything the reports are computed from, prepared once per data version:
+# load (typed and compacted) -> discipline flags -> (Pitcher, Date) index -> aggregate cube
+# -> D1-wide percentile ranks, plus the game-level rollup kept alongside the columnar store.
+# The pitch table is memory-mapped from the shared Arrow file for the version (see
+# pitch_data.load_prepared), so processes share one copy; it is read-only, and nothing
+# downstream modifies it. Given the previous version's data, the cube is refreshed for
+# changed pitchers only and the filter/density/table caches carry over (their keys hold
+# per-pitcher versions, and the data version for tables with D1-wide percentile ranks).
+# Sources too large to load whole (see pitch_data.use_chunked_ingest) go through the
+# chunked ingest instead: there is no full pitch table, cube or game rollup (df, index,
+# cube and games are None), only the selected pitcher's partition, cube and games are
+# ever read (see pitcher_index, pitcher_cube and pitcher_games), and the ranks and comps
+# come from the season sums written at ingest.
+class ReportData:
+    def __init__(self, path, previous=None):
+        self.path = path
+        self.store = None
+        if pitch_data.use_chunked_ingest(path):
+            self.store = pitch_data.PartitionedStore(path)
+            self.df, self.index = None, None
+            self.version, self._pitchers, self.pitches = self.store.version, self.store.pitchers, self.store.rows
+            self.cube, self.games = None, None
+            self.sums = self.store.pitch_type_sums
+        else:
+            self.df, self.version, self._pitchers = pitch_data.load_prepared(path)
+            self.pitches = len(self.df)
+            versions = pitch_data.pitcher_versions(path)
+            self.index = pitch_data.PitcherIndex(self.df, self.version, versions, is_sorted=True)
+            if previous is None:
+                self.cube = pitch_data.AggregateCube(self.df, self.version, versions)
+            else:
+                self.cube = previous.cube.refreshed(self.df, self.version, versions)
+            self.games = pitch_data.GameRollup(pitch_data.load_game_rollup(path))
+            self.sums = pitch_data.pitch_type_sums(self.cube.cells)
+        if previous is None:
+            self.filter_cache = pitch_data.LRUCache(maxsize=64)
+            self.density_cache = pitch_data.LRUCache(maxsize=256)
+            self.table_cache = pitch_data.LRUCache(maxsize=128)
+        else:
+            self.filter_cache = previous.filter_cache
+            self.density_cache = previous.density_cache
+            self.table_cache = previous.table_cache
+        self.ranks = pitch_data.PercentileRanks(self.sums)
+        self._comps = None
+        self._comps_lock = threading.Lock()
+
+    # Pitchers in the data, in the order they first appear
+    def pitchers(self):
+        return self._pitchers
+
+    # Pitch comp search (a pitch_data.PitchComps), built on first use since it imports scipy
+    def comps(self):
+        with self._comps_lock:
+            if self._comps is None:
+                self._comps = pitch_data.PitchComps(self.sums)
+            return self._comps
+
+    # PitcherIndex to filter a pitcher's pitches with: the whole table's, or just the
+    # pitcher's partition for a chunked source
+    def pitcher_index(self, pitcher_name):
+        if self.store is None:
+            return self.index
+        return self.store.pitcher_index(pitcher_name)
+
+    # AggregateCube to roll a pitcher's selections up from: the whole data's, or just the
+    # pitcher's cells for a chunked source
+    def pitcher_cube(self, pitcher_name):
+        if self.store is None:
+            return self.cube
+        return self.store.cube(pitcher_name)
+
+    # GameRollup holding a pitcher's games: the whole data's, or just the pitcher's for
+    # a chunked source
+    def pitcher_games(self, pitcher_name):
+        if self.store is None:
+            return self.games
+        return self.store.games(pitcher_name)
+
+    def filter_data(self, *filters):
+        index = self.pitcher_index(filters[0])
+        return self.filter_cache.get(
+            pitch_data.filter_key(index, *filters),
+            lambda: pitch_data.filter_pitches(index, *filters)
+        )
+
+    # All report sections for one selection, without any Streamlit output. Heat map
+    # panels are returned as render_heatmap_panel arguments, not rendered.
+    def report(self, *filters):
+        pitcher_name, batter_side, strikes, balls = filters[:4]
+        pitcher_data = self.filter_data(*filters)
+        plot_data = heatmap_data(pitcher_data)
+        cube = self.pitcher_cube(pitcher_name)
+        return {
+            'pitcher': pitcher_name,
+            'batter_side': batter_side,
+            'title': heatmap_title(pitcher_name, batter_side, strikes, balls),
+            'pitches': len(pitcher_data),
+            'heatmap_panels': heatmap_panels(plot_data, pitcher_name, pitch_data.filter_key(self.pitcher_index(pitcher_name), *filters), self.density_cache),
+            'plate_discipline': plate_discipline_table(cube, *filters),
+            'pitch_traits': pitch_traits_table(cube, *filters),
+            'movement': movement_data(pitcher_data),
+        }
@@ -0,0 +1,158 @@
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+import weakref
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Structured timing records, one JSON object per line
+logger = logging.getLogger('pitch_timing')
+
+# Name of the JSON lines log written next to the columnar cache
+LOG_NAME = 'timings.jsonl'
+
+# Environment variable overriding where the timing log is written
+LOG_ENV = 'PITCH_TIMING_LOG'
+
+_logging_lock = threading.Lock()
+
+# tracemalloc is process-wide and slows every allocation, so it only runs while at
+# least one trace asks for memory figures
+_memory_lock = threading.Lock()
+_memory_users = 0
+
+
+def _start_memory_tracing():
+    global _memory_users
+    with _memory_lock:
+        if _memory_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _memory_users += 1
+
+
+def _stop_memory_tracing():
+    global _memory_users
+    with _memory_lock:
+        _memory_users -= 1
+        if _memory_users == 0 and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# Send the timing records to a size-capped JSON lines file (once per process).
+# PITCH_TIMING_LOG overrides the path; set it to "-" to log to stderr instead.
+def configure_logging(path):
+    with _logging_lock:
+        if logger.handlers:
+            return
+        path = os.environ.get(LOG_ENV, path)
+        if path == '-':
+            handler = logging.StreamHandler()
+        else:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = RotatingFileHandler(path, maxBytes=5 << 20, backupCount=3)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+# Number of rows in a DataFrame/array result, or None
+def rows(value):
+    if value is None:
+        return None
+    try:
+        return len(value)
+    except TypeError:
+        return None
+
+
+# Timing spans for one run of the script (one Streamlit rerun or one report).
+# Each span records wall time, rows in/out and, when `memory` is on, the peak
+# traced allocation above what was allocated when the span started. Memory figures
+# cover Python/numpy allocations only, and overlap when several sessions trace at once.
+class Trace:
+    def __init__(self, name='rerun', memory=False, **context):
+        self.name = name
+        self.context = context
+        self.run_id = uuid.uuid4().hex[:12]
+        self.memory = memory
+        self.spans = []
+        self._stack = []
+        self._started = time.perf_counter()
+        self._finished = None
+        if memory:
+            _start_memory_tracing()
+            # Released on finish(), or when an interrupted rerun drops the trace
+            self._release_memory = weakref.finalize(self, _stop_memory_tracing)
+
+    # Fold the peak reached so far into every open span before the peak is reset
+    def _fold_peak(self):
+        _, peak = tracemalloc.get_traced_memory()
+        for span in self._stack:
+            span['_peak'] = max(span['_peak'], peak)
+        return peak
+
+    # Time the enclosed block; the yielded record can be given `rows_out` (and any
+    # other fields) by the caller
+    @contextmanager
+    def span(self, name, rows_in=None):
+        record = {'name': name, 'depth': len(self._stack), 'rows_in': rows_in, 'rows_out': None}
+        self.spans.append(record)
+        if self.memory:
+            self._fold_peak()
+            tracemalloc.reset_peak()
+            record['_start_bytes'], record['_peak'] = tracemalloc.get_traced_memory()
+        self._stack.append(record)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record['error'] = type(e).__name__
+            raise
+        finally:
+            record['ms'] = round((time.perf_counter() - started) * 1000, 3)
+            if self.memory:
+                self._fold_peak()
+                record['peak_mb'] = round((record.pop('_peak') - record.pop('_start_bytes')) / 1e6, 3)
+            self._stack.pop()
+
+    @property
+    def finished(self):
+        return self._finished is not None
+
+    # Close the trace and log it as a single JSON record; returns the record
+    def finish(self):
+        if self._finished is None:
+            self._finished = {
+                'event': self.name,
+                'run_id': self.run_id,
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'total_ms': round((time.perf_counter() - self._started) * 1000, 3),
+                **self.context,
+                'spans': self.spans,
+            }
+            if resource is not None:
+                # ru_maxrss is in KB on Linux
+                self._finished['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1e3, 1)
+            if self.memory:
+                self._release_memory()
+            logger.info(json.dumps(self._finished, default=str))
+        return self._finished
+
+    # Spans as a table for display, nested spans indented under their parent
+    def table(self):
+        table = pd.DataFrame(self.spans, columns=['name', 'depth', 'ms', 'rows_in', 'rows_out', 'peak_mb'])
+        table['name'] = ['  ' * depth + name for name, depth in zip(table['name'], table['depth'])]
+        table[['rows_in', 'rows_out']] = table[['rows_in', 'rows_out']].astype('Int64')
+        return table.drop(columns='depth').rename(columns={'name': 'Stage'})
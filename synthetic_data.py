@@ -0,0 +1,150 @@
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import pitch_data
+
+# Pitch type -> (velocity mph, spin rpm, induced vertical break in, horizontal break in)
+# for a right-handed pitcher; lefties mirror the horizontal break
+pitch_type_profiles = {
+    'Four-Seam': (90, 2250, 16, 8),
+    'Sinker': (89, 2150, 8, 15),
+    'Cutter': (86, 2350, 8, -3),
+    'Slider': (81, 2450, 1, -6),
+    'Curveball': (76, 2500, -9, -8),
+    'ChangeUp': (82, 1750, 7, 13),
+    'Splitter': (83, 1450, 3, 9),
+}
+
+pitch_calls = ['BallCalled', 'StrikeCalled', 'StrikeSwinging', 'FoulBallNotFieldable',
+               'FoulBallFieldable', 'InPlay', 'HitByPitch', 'BallinDirt']
+
+# Pitch call probabilities for pitches in / out of the strike zone
+in_zone_call_odds = [0.02, 0.30, 0.11, 0.22, 0.03, 0.31, 0.0, 0.01]
+out_of_zone_call_odds = [0.55, 0.05, 0.10, 0.08, 0.01, 0.09, 0.01, 0.11]
+
+# Roughly how many pitches a D1 pitcher throws in a season, and over how many outings
+pitches_per_pitcher_season = 1200
+appearances_per_season = 15
+
+
+# Rows generated and written at a time by write_pitches, so a 10M-row CSV (with its
+# filler columns) never has to be held in memory whole
+chunk_rows = 50_000
+
+
+# Generate `rows` synthetic TrackMan pitches with the columns the app reads, spread over
+# pitchers, seasons and games the way a real all-D1 export is, as DataFrames of at most
+# `chunk_rows` pitches in (Date, Pitcher) order. `extra_columns` pads the table with
+# filler columns so CSV parsing costs resemble the ~170-column export; they are random
+# noise, so each chunk's are only drawn once it has been sorted.
+def generate_chunks(rows, seed=0, extra_columns=0, chunk_rows=chunk_rows):
+    rng = np.random.default_rng(seed)
+    seasons = max(1, rows // 2_000_000)
+    n_pitchers = max(1, rows // (pitches_per_pitcher_season * seasons))
+
+    # Per-pitcher handedness, arm slot and a 3-5 pitch arsenal with usage weights
+    throws_left = rng.random(n_pitchers) < 0.3
+    rel_height = rng.normal(5.8, 0.35, n_pitchers)
+    rel_side = np.where(throws_left, 1, -1) * rng.normal(1.8, 0.5, n_pitchers)
+    extension = rng.normal(6.0, 0.35, n_pitchers)
+    type_names = np.array(list(pitch_type_profiles))
+    arsenal_size = rng.integers(3, 6, n_pitchers)
+    arsenals = np.argsort(rng.random((n_pitchers, len(type_names))), axis=1)[:, :5]
+    usage = rng.gamma(2.0, 1.0, (n_pitchers, 5)) * (np.arange(5) < arsenal_size[:, None])
+    cumulative_usage = np.cumsum(usage, axis=1) / usage.sum(axis=1, keepdims=True)
+    offsets = rng.normal(0, 1, (n_pitchers, len(type_names), 4)) * [2.0, 120, 2.0, 2.0]
+
+    # Each pitch belongs to one of its pitcher's appearances (slots of 8 days that don't
+    # overlap), so generating the slots in order gives chunks in date order
+    slots = appearances_per_season * seasons
+    slot_rows = rng.multinomial(rows, np.full(slots, 1 / slots))
+    slot_bounds = np.r_[0, np.cumsum(slot_rows)]
+    chunk_starts = np.r_[0, np.flatnonzero(np.diff(slot_bounds // max(1, chunk_rows)) > 0) + 1]
+    chunk_stops = np.r_[chunk_starts[1:], slots]
+
+    for first, stop in zip(chunk_starts, chunk_stops):
+        n = slot_bounds[stop] - slot_bounds[first]
+        if n == 0:
+            continue
+        appearance = np.repeat(np.arange(first, stop), slot_rows[first:stop])
+        pitcher = rng.integers(0, n_pitchers, n)
+        # Games fall between mid-February and June
+        season = appearance // appearances_per_season
+        game_day = (appearance % appearances_per_season) * 8 + (pitcher % 7)
+        dates = (np.datetime64('2024-02-16') + (season * 365 + game_day).astype('timedelta64[D]'))
+
+        # Pick each pitch's type from its pitcher's arsenal by usage
+        choice = (rng.random(n)[:, None] > cumulative_usage[pitcher]).sum(axis=1)
+        type_index = arsenals[pitcher, np.minimum(choice, arsenal_size[pitcher] - 1)]
+
+        profile = np.array(list(pitch_type_profiles.values()))[type_index] + offsets[pitcher, type_index]
+        profile += rng.normal(0, 1, (n, 4)) * [1.0, 60, 1.8, 1.8]
+        hand = np.where(throws_left[pitcher], -1, 1)
+
+        side = rng.normal(0, 0.85, n)
+        height = rng.normal(2.45, 0.75, n)
+        in_zone = ((height >= pitch_data.zone_bottom) & (height <= pitch_data.zone_top)
+                   & (np.abs(side) <= pitch_data.zone_half_width))
+        calls = np.where(in_zone,
+                         rng.choice(len(pitch_calls), n, p=in_zone_call_odds),
+                         rng.choice(len(pitch_calls), n, p=out_of_zone_call_odds))
+        exit_speed = np.where(np.array(pitch_calls)[calls] == 'InPlay', rng.normal(85, 12, n), np.nan)
+
+        df = pd.DataFrame({
+            'Date': dates,
+            'Pitcher': np.char.add('Pitcher ', pitcher.astype(str)),
+            'BatterSide': np.where(rng.random(n) < 0.55, 'Right', 'Left'),
+            'Balls': rng.choice(4, n, p=[0.40, 0.30, 0.20, 0.10]),
+            'Strikes': rng.choice(3, n, p=[0.40, 0.33, 0.27]),
+            'AutoPitchType': type_names[type_index],
+            'PitchCall': np.array(pitch_calls)[calls],
+            'PlateLocSide': side,
+            'PlateLocHeight': height,
+            'RelSpeed': profile[:, 0],
+            'SpinRate': profile[:, 1],
+            'Tilt': rng.choice(['12:30', '1:15', '2:00', '10:45', '11:30'], n),
+            'RelHeight': rel_height[pitcher] + rng.normal(0, 0.1, n),
+            'RelSide': rel_side[pitcher] + rng.normal(0, 0.1, n),
+            'Extension': extension[pitcher] + rng.normal(0, 0.1, n),
+            'InducedVertBreak': profile[:, 2],
+            'HorzBreak': profile[:, 3] * hand,
+            'VertApprAngle': rng.normal(-6.5, 1.2, n),
+            'ExitSpeed': exit_speed,
+        })
+        # TrackMan leaves some locations blank (e.g. untracked pitches)
+        df.loc[rng.random(n) < 0.01, ['PlateLocSide', 'PlateLocHeight']] = np.nan
+        df = df.sort_values(['Date', 'Pitcher'], kind='stable').reset_index(drop=True)
+
+        for start in range(0, n, max(1, chunk_rows)):
+            chunk = df.iloc[start:start + chunk_rows].reset_index(drop=True)
+            if extra_columns:
+                extra = np.round(rng.random((len(chunk), extra_columns)), 4)
+                chunk = pd.concat([chunk, pd.DataFrame(extra, columns=[f'Extra{i}' for i in range(extra_columns)])], axis=1)
+            yield chunk
+
+
+# All of generate_chunks' pitches as one DataFrame
+def generate_pitches(rows, seed=0, extra_columns=0):
+    return pd.concat(generate_chunks(rows, seed, extra_columns), ignore_index=True)
+
+
+# Write a synthetic CSV one chunk at a time (under a temp name, renamed when complete,
+# so an interrupted run never leaves a partial file behind)
+def write_pitches(rows, out, seed=0, extra_columns=0, chunk_rows=chunk_rows):
+    tmp_path = f"{out}.tmp"
+    for i, chunk in enumerate(generate_chunks(rows, seed, extra_columns, chunk_rows)):
+        chunk.to_csv(tmp_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+    os.replace(tmp_path, out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Write a synthetic TrackMan CSV.")
+    parser.add_argument('rows', type=int)
+    parser.add_argument('out', help="Output CSV path")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--extra-columns', type=int, default=150)
+    args = parser.parse_args()
+    write_pitches(args.rows, args.out, args.seed, args.extra_columns)